@@ -1,6 +1,20 @@
+import concurrent.futures
+import os
 import random
+import time
 
+from shallowBlue import Book
 from shallowBlue import ChessEngine
+from shallowBlue import Transposition
+
+MATE_SCORE = 100000
+INFINITY = 1000000
+MAX_PLY = 64
+# move ordering values for MVV-LVA by piece code, the king ranks last as an attacker, EMPTY is no capture
+ORDER_VALUE = [1, 3, 3, 5, 9, 10, 1, 3, 3, 5, 9, 10, 0]
+CAPTURE_MASK = 15 << 16
+EMPTY_CAPTURE = ChessEngine.EMPTY << 16
+PROMOTION_BIT = ChessEngine.FLAG_PROMOTION << 20
 
 
 class Agent:
@@ -14,6 +28,19 @@ class RandomAgent(Agent):
         return validMoves[random.randint(0, len(validMoves) - 1)]
 
 
+# plays from an opening book (see Book.BuildBook) while the position is in it, then asks agent
+class BookAgent(Agent):
+    def __init__(self, agent, bookPath):
+        self.agent = agent
+        self.book = Book.BookDataStruct(bookPath)
+
+    def getAction(self, gameState):
+        move = Book.ChooseBookMove(gameState, self.book)
+        if move is not None:
+            return move
+        return self.agent.getAction(gameState)
+
+
 class GreedyAgent(Agent):
     def __init__(self, eFunction):
         self.evalFunction = eFunction
@@ -22,10 +49,19 @@ class GreedyAgent(Agent):
         moves = gameState.getValidMoves()
         if gameState.checkmate or gameState.stalemate:
             return None
+        # evalFunction scores for white, black wants the lowest score
+        sign = 1 if gameState.whiteToMove else -1
         scores = []
         for move in moves:
             gameState.makeMove(move)
-            scores.append(self.evalFunction(gameState))
+            score = sign * self.evalFunction(gameState)
+            # a piece left hanging is lost: score the move after the reply that wins the most by static exchange
+            for reply in gameState.getCaptureCodes():
+                if gameState.see(reply) > 0:
+                    gameState.makeMove(reply)
+                    score = min(score, sign * self.evalFunction(gameState))
+                    gameState.undoMove()
+            scores.append(score)
             gameState.undoMove()
         bestScore = max(scores)
         bestMoves = [moves[i] for i in range(0, len(moves)) if scores[i] == bestScore]
@@ -66,52 +102,318 @@ class EAgent(Agent):
 
 
 
+# negamax alpha-beta search played directly on the GameState with makeMove/undoMove
+# works on move codes (see ChessEngine.encodeMove), only the returned move is a Move object
+# evalFunction scores a position for white, like ChessEngine.materialBalance
+# iterative deepening up to depth, stopping early once timeLimit (seconds) or nodeLimit is used up;
+# the move of the last completed iteration is played
+# reporter, if given, is called with an info dict (depth, score, nodes, time, nps, pv) after each iteration
 class ABAgent(Agent):
-    def __init__(self, eFunction):
+    def __init__(self, eFunction, depth=3, tableSizeMB=16, timeLimit=None, nodeLimit=None, reporter=None):
         self.evalFunction = eFunction
+        self.depth = depth
+        self.timeLimit = timeLimit
+        self.nodeLimit = nodeLimit
+        self.reporter = reporter
+        self.table = Transposition.TranspositionTable(tableSizeMB)
+        self.nodes = 0
+        self.bestMove = None
+        self.killers = [[None, None] for _ in range(MAX_PLY)]
+        self.history = {}
+        self.iterations = []
+        self.deadline = None
+        self.canStop = False  # never abort the first iteration, there would be no move to play
+        self.stopped = False
+        self.stopRequested = False
 
-    def maxValue(self, gameState, depth, alpha0, beta0):
-        if gameState.isWin() or gameState.isLose() or depth > self.depth:
-            return self.evalFunction(gameState)
-        val = float("-inf")
-        alpha = alpha0
-        for action in gameState.getLegalActions(0):
-            val = max(val, self.minValue(gameState.generateSuccessor(0, action), 1, depth, alpha, beta0))
-            if val > beta0:
-                return val
-            alpha = max(alpha, val)
-        return val
+    # ask a running search to return as soon as possible, e.g. from another thread
+    # a stop sent just before getAction starts still counts, the request is cleared when getAction returns
+    def stop(self):
+        self.stopRequested = True
 
-    def minValue(self, gameState, index, depth, alpha0, beta0):
-        if gameState.isWin() or gameState.isLose():
-            return self.evalFunction(gameState)
-        val = float("inf")
-        beta = beta0
-        if index != (gameState.getNumAgents() - 1):
-            for action in gameState.getLegalActions(index):
-                val = min(val,
-                          self.minValue(gameState.generateSuccessor(index, action), index + 1, depth, alpha0, beta))
-                if val < alpha0:
-                    return val
-                beta = min(beta, val)
-            return val
+    def outOfBudget(self):
+        if self.stopRequested:
+            return True
+        if self.nodeLimit is not None and self.nodes >= self.nodeLimit:
+            return True
+        # reading the clock is slow compared to a node, so only look every 1024 nodes
+        return self.deadline is not None and self.nodes & 1023 == 0 and time.perf_counter() >= self.deadline
+
+    # score from the point of view of the side to move
+    def evaluate(self, gameState):
+        score = self.evalFunction(gameState)
+        return score if gameState.whiteToMove else -score
+
+    # hash move first, then captures by MVV-LVA, then killers, then quiet moves by history
+    # with gameState, a capture of a cheaper piece that loses by static exchange goes after the quiet moves
+    def orderMoves(self, moves, ply, hashMove=None, gameState=None):
+        killers = self.killers[ply] if ply < MAX_PLY else (None, None)
+        history = self.history
+
+        def priority(move):
+            if move == hashMove:
+                return 1 << 30
+            if move & CAPTURE_MASK != EMPTY_CAPTURE or move & PROMOTION_BIT:
+                if gameState is not None and ORDER_VALUE[move >> 16 & 15] < ORDER_VALUE[move >> 12 & 15] and \
+                        not move & PROMOTION_BIT:
+                    gain = gameState.see(move)
+                    if gain < 0:
+                        return gain - (1 << 20)
+                return (1 << 20) + ORDER_VALUE[move >> 16 & 15] * 10 - ORDER_VALUE[move >> 12 & 15] + \
+                       (ORDER_VALUE[ChessEngine.QUEEN] * 10 if move & PROMOTION_BIT else 0)
+            if move == killers[0] or move == killers[1]:
+                return 1 << 19
+            # history is indexed by moving piece and end square
+            return history.get(move >> 6 & 1023, 0)
+
+        moves.sort(key=priority, reverse=True)
+
+    # a quiet move caused a cutoff: remember it for the siblings and for later searches
+    def storeCutoff(self, move, depth, ply):
+        if ply < MAX_PLY and move != self.killers[ply][0]:
+            self.killers[ply][1] = self.killers[ply][0]
+            self.killers[ply][0] = move
+        key = move >> 6 & 1023
+        self.history[key] = self.history.get(key, 0) + depth * depth
+
+    def negamax(self, gameState, depth, alpha, beta, ply):
+        self.nodes += 1
+        if self.canStop and self.outOfBudget():
+            self.stopped = True
+            return 0
+        # a repeated position is scored as a draw, playing on from it cannot be better than the first time
+        if ply > 0 and (gameState.halfmoveClock >= 100 or gameState.isRepetition()):
+            return 0
+        alpha0 = alpha
+        key = gameState.zobristKey
+        hashMove = None
+        entry = self.table.probe(key)
+        if entry is not None:
+            hashMove = entry[3]
+            if entry[0] >= depth and ply > 0:
+                score = scoreFromTable(entry[2], ply)
+                if entry[1] == Transposition.EXACT or \
+                        (entry[1] == Transposition.LOWER_BOUND and score >= beta) or \
+                        (entry[1] == Transposition.UPPER_BOUND and score <= alpha):
+                    return score
+        if depth <= 0:
+            return self.quiescence(gameState, alpha, beta, ply)
+
+        moves = gameState.getValidMoveCodes()
+        if len(moves) == 0:
+            # checkmate: prefer the shortest mate, stalemate is a draw
+            return -MATE_SCORE + ply if gameState.checkmate else 0
+        self.orderMoves(moves, ply, hashMove, gameState)
+        best = -INFINITY
+        bestMove = None
+        for move in moves:
+            gameState.makeMove(move)
+            score = -self.negamax(gameState, depth - 1, -beta, -alpha, ply + 1)
+            gameState.undoMove()
+            if self.stopped:
+                return 0
+            if score > best:
+                best = score
+                bestMove = move
+                if ply == 0:
+                    self.bestMove = move
+            if score > alpha:
+                alpha = score
+            if alpha >= beta:
+                if move & CAPTURE_MASK == EMPTY_CAPTURE and not move & PROMOTION_BIT:
+                    self.storeCutoff(move, depth, ply)
+                break
+
+        if best <= alpha0:
+            flag = Transposition.UPPER_BOUND
+        elif best >= beta:
+            flag = Transposition.LOWER_BOUND
         else:
-            # only increment depth at the maximizers
-            for action in gameState.getLegalActions(index):
-                val = min(val, self.maxValue(gameState.generateSuccessor(index, action), depth + 1, alpha0, beta))
-                if val < alpha0:
-                    return val
-                beta = min(beta, val)
-            return val
+            flag = Transposition.EXACT
+        self.table.store(key, depth, flag, scoreToTable(best, ply), bestMove)
+        return best
+
+    # only captures and promotions, until the position is quiet
+    def quiescence(self, gameState, alpha, beta, ply):
+        self.nodes += 1
+        if self.canStop and self.outOfBudget():
+            self.stopped = True
+            return 0
+        standPat = self.evaluate(gameState)
+        if standPat >= beta:
+            return standPat
+        if standPat > alpha:
+            alpha = standPat
+        # captures that lose material by static exchange are not searched, the rest go best exchange first
+        moves = []
+        for move in gameState.getCaptureCodes():
+            gain = gameState.see(move)
+            if gain >= 0:
+                moves.append((gain, move))
+        moves.sort(reverse=True)
+        for gain, move in moves:
+            gameState.makeMove(move)
+            score = -self.quiescence(gameState, -beta, -alpha, ply + 1)
+            gameState.undoMove()
+            if self.stopped:
+                return 0
+            if score >= beta:
+                return score
+            if score > alpha:
+                alpha = score
+        return alpha
+
+    # follow the best moves stored in the table from the current position
+    def principalVariation(self, gameState, depth):
+        pv = []
+        seen = set()
+        while len(pv) < depth and gameState.zobristKey not in seen:
+            seen.add(gameState.zobristKey)
+            entry = self.table.probe(gameState.zobristKey)
+            if entry is None or entry[3] not in gameState.getValidMoveCodes():
+                break
+            pv.append(ChessEngine.Move.fromCode(entry[3]))
+            gameState.makeMove(entry[3])
+        for _ in pv:
+            gameState.undoMove()
+        return pv
 
     def getAction(self, gameState):
-        optAction = gameState.getLegalActions(0)[0]
-        optValue = float("-inf")
-        alpha = float("-inf")
-        for action in gameState.getLegalActions(0):
-            newValue = self.minValue(gameState.generateSuccessor(0, action), 1, 1, alpha, float("inf"))
-            if newValue > optValue:
-                optValue = newValue
-                optAction = action
-            alpha = max(alpha, optValue)
-        return optAction
\ No newline at end of file
+        self.nodes = 0
+        self.stopped = False
+        self.table.newSearch()
+        self.killers = [[None, None] for _ in range(MAX_PLY)]
+        self.iterations = []
+        start = time.perf_counter()
+        self.deadline = start + self.timeLimit if self.timeLimit is not None else None
+        bestMove = None
+        for depth in range(1, self.depth + 1):
+            self.bestMove = None
+            self.canStop = depth > 1
+            score = self.negamax(gameState, depth, -INFINITY, INFINITY, 0)
+            if self.stopped:
+                break
+            bestMove = self.bestMove
+            elapsed = time.perf_counter() - start
+            info = {"depth": depth, "score": score, "nodes": self.nodes, "time": elapsed,
+                    "nps": int(self.nodes / elapsed) if elapsed > 0 else 0,
+                    "pv": self.principalVariation(gameState, depth)}
+            self.iterations.append(info)
+            if self.reporter is not None:
+                self.reporter(info)
+            # no legal move, or a forced mate that deeper searches cannot improve
+            if bestMove is None or abs(score) > MATE_SCORE - MAX_PLY:
+                break
+            # the next iteration takes several times longer, don't start one that cannot finish
+            if self.deadline is not None and elapsed > self.timeLimit / 2:
+                break
+        self.canStop = False
+        self.stopRequested = False
+        return ChessEngine.Move.fromCode(bestMove) if bestMove is not None else None
+
+
+# mate scores are stored relative to the node, so they stay right when reached from another ply
+def scoreToTable(score, ply):
+    if score > MATE_SCORE - MAX_PLY:
+        return score + ply
+    if score < -MATE_SCORE + MAX_PLY:
+        return score - ply
+    return score
+
+
+def scoreFromTable(score, ply):
+    if score > MATE_SCORE - MAX_PLY:
+        return score - ply
+    if score < -MATE_SCORE + MAX_PLY:
+        return score + ply
+    return score
+
+
+# each worker process keeps one ABAgent per eval function, reset before every root move
+_workerAgents = {}
+
+
+def _searchRootMove(task):
+    fen, history, move, depth, alpha, evalFunction, tableSizeMB, deadline = task
+    gameState = ChessEngine.GameState(fen)
+    for code in history:
+        gameState.makeMove(code)
+    agent = _workerAgents.get(evalFunction)
+    if agent is None:
+        agent = _workerAgents[evalFunction] = ABAgent(evalFunction, tableSizeMB=tableSizeMB)
+    # a fresh table and fresh heuristics, so the score never depends on which tasks ran here before
+    agent.table.clear()
+    agent.killers = [[None, None] for _ in range(MAX_PLY)]
+    agent.history = {}
+    agent.nodes = 0
+    agent.stopped = False
+    agent.stopRequested = False
+    # deadline is wall clock time, the agent counts on perf_counter
+    agent.deadline = time.perf_counter() + deadline - time.time() if deadline is not None else None
+    agent.canStop = deadline is not None
+    gameState.makeMove(move)
+    score = -agent.negamax(gameState, depth - 1, -INFINITY, -alpha, 1)
+    agent.canStop = False
+    return score, agent.nodes, agent.stopped
+
+
+# root splitting over a process pool, one iteration of iterative deepening at a time:
+# the first (best so far) root move is searched alone, then all the others in parallel with its score as alpha,
+# so they can still be cut off
+# the best score wins, ties go to the move listed first, so the result does not depend on scheduling
+# workers defaults to the number of CPUs; evalFunction must be picklable (a module level function)
+# tableSizeMB is the table of each worker, the agent itself only uses ABAgent's move ordering
+class ParallelAgent(ABAgent):
+    def __init__(self, eFunction, depth=3, workers=None, tableSizeMB=16, timeLimit=None, reporter=None):
+        ABAgent.__init__(self, eFunction, depth=depth, tableSizeMB=1, timeLimit=timeLimit, reporter=reporter)
+        self.workers = workers or os.cpu_count() or 1
+        self.tableSizeMB = tableSizeMB
+        self.executor = None
+
+    # shut the worker processes down, a later getAction starts them again
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
+            self.executor = None
+
+    def getAction(self, gameState):
+        rootMoves = gameState.getValidMoveCodes()
+        if len(rootMoves) <= 1:
+            return ChessEngine.Move.fromCode(rootMoves[0]) if rootMoves else None
+        self.orderMoves(rootMoves, 0)
+        if self.executor is None:
+            self.executor = concurrent.futures.ProcessPoolExecutor(max_workers=self.workers)
+        self.nodes = 0
+        self.iterations = []
+        start = time.time()
+        deadline = start + self.timeLimit if self.timeLimit is not None else None
+        bestMove = None
+        for depth in range(1, self.depth + 1):
+            # the first iteration always finishes, so there is a move to play
+            limit = deadline if depth > 1 else None
+            first = self.executor.submit(_searchRootMove, (gameState.startFen, gameState.moveLog, rootMoves[0], depth,
+                                                           -INFINITY, self.evalFunction, self.tableSizeMB, limit))
+            results = [first.result()]
+            tasks = [(gameState.startFen, gameState.moveLog, move, depth, results[0][0], self.evalFunction,
+                      self.tableSizeMB, limit) for move in rootMoves[1:]]
+            results += self.executor.map(_searchRootMove, tasks)
+            self.nodes += sum(nodes for score, nodes, stopped in results)
+            if any(stopped for score, nodes, stopped in results):
+                break
+            # best first for the next iteration, sorted() is stable so equal scores keep their order
+            order = sorted(range(len(rootMoves)), key=lambda i: -results[i][0])
+            rootMoves = [rootMoves[i] for i in order]
+            bestScore = results[order[0]][0]
+            bestMove = rootMoves[0]
+            elapsed = time.time() - start
+            info = {"depth": depth, "score": bestScore, "nodes": self.nodes, "time": elapsed,
+                    "nps": int(self.nodes / elapsed) if elapsed > 0 else 0,
+                    "pv": [ChessEngine.Move.fromCode(bestMove)]}
+            self.iterations.append(info)
+            if self.reporter is not None:
+                self.reporter(info)
+            if abs(bestScore) > MATE_SCORE - MAX_PLY:
+                break
+            if deadline is not None and elapsed > self.timeLimit / 2:
+                break
+        return ChessEngine.Move.fromCode(bestMove)
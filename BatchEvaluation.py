@@ -0,0 +1,90 @@
+"""
+Batch evaluation with NumPy: the scalar terms of Evaluation for N positions at once, with the same integer results.
+Positions are (N, 64) piece codes (GameState.toArray) or (N, 12, 8, 8) piece planes (GameState.toPlanes).
+Kept apart from Evaluation so the engine and the UCI front end start without loading NumPy.
+"""
+
+import numpy as np
+
+from shallowBlue import Evaluation as ev
+
+EMPTY = 12
+_SQUARES = np.arange(64)
+_MATERIAL = np.array(ev.MATERIAL + [0], dtype=np.int64)
+_MG = np.array(ev.MG_TABLE + [[0] * 64], dtype=np.int64)
+_EG = np.array(ev.EG_TABLE + [[0] * 64], dtype=np.int64)
+_PHASE = np.array(ev.PHASE_WEIGHT + [0], dtype=np.int64)
+
+
+def _maskMatrix(masks):
+    # [color] (64, 64) 0/1 matrix, row sq holds the bits of masks[color][sq]
+    return np.array([[[mask >> target & 1 for target in range(64)] for mask in masks[color]] for color in (0, 1)],
+                    dtype=np.int64)
+
+
+_PASSED_MATRIX = _maskMatrix(ev.PASSED_MASK)
+_SHELTER_MATRIX = _maskMatrix(ev.SHELTER_MASK)
+# passed pawn bonus by square, [color][mg or eg][sq]
+_PASSED_BONUS = np.array([[[ev.PASSED_PAWN[min(max(6 - (sq >> 3) if color == 0 else (sq >> 3) - 1, 0), 7)][term]
+                            for sq in range(64)] for term in (0, 1)] for color in (0, 1)], dtype=np.int64)
+
+
+def pieceCodes(positions):
+    positions = np.asarray(positions)
+    if positions.ndim == 4:
+        planes = positions.reshape(len(positions), 12, 64)
+        return np.where(planes.any(axis=1), planes.argmax(axis=1), EMPTY)
+    return positions.reshape(len(positions), 64).astype(np.int64)
+
+
+# materialBalance of every position
+def batchMaterial(positions):
+    return _MATERIAL[pieceCodes(positions)].sum(axis=1)
+
+
+# taperedEval of every position
+def batchTapered(positions):
+    codes = pieceCodes(positions)
+    return _batchTaper(_MG[codes, _SQUARES].sum(axis=1), _EG[codes, _SQUARES].sum(axis=1), _PHASE[codes].sum(axis=1))
+
+
+def _batchTaper(mg, eg, phase):
+    phase = np.minimum(phase, ev.MAX_PHASE)
+    return (mg * phase + eg * (ev.MAX_PHASE - phase)) // ev.MAX_PHASE
+
+
+def _batchSide(color, pawns, enemyPawns, kings):
+    counts = pawns.reshape(-1, 8, 8).sum(axis=1)  # pawns per file
+    extra = np.maximum(counts - 1, 0).sum(axis=1)
+    padded = np.pad(counts, ((0, 0), (1, 1)))
+    isolated = (counts * ((padded[:, :-2] + padded[:, 2:]) == 0)).sum(axis=1)
+    passed = pawns * (enemyPawns @ _PASSED_MATRIX[color].T == 0)
+    shelter = (pawns * _SHELTER_MATRIX[color][kings.argmax(axis=1)]).sum(axis=1)
+    mg = ev.DOUBLED_PAWN[0] * extra + ev.ISOLATED_PAWN[0] * isolated + passed @ _PASSED_BONUS[color][0] + \
+        ev.KING_SHELTER[0] * shelter
+    eg = ev.DOUBLED_PAWN[1] * extra + ev.ISOLATED_PAWN[1] * isolated + passed @ _PASSED_BONUS[color][1] + \
+        ev.KING_SHELTER[1] * shelter
+    return mg, eg
+
+
+# pawnKingTerms of every position as (mg, eg) arrays
+def batchPawnKingTerms(positions):
+    codes = pieceCodes(positions)
+    whitePawns = (codes == 0).astype(np.int64)
+    blackPawns = (codes == 6).astype(np.int64)
+    whiteMg, whiteEg = _batchSide(0, whitePawns, blackPawns, codes == 5)
+    blackMg, blackEg = _batchSide(1, blackPawns, whitePawns, codes == 11)
+    return whiteMg - blackMg, whiteEg - blackEg
+
+
+# pawnStructure of every position
+def batchPawnStructure(positions):
+    codes = pieceCodes(positions)
+    mg, eg = batchPawnKingTerms(codes)
+    return _batchTaper(mg, eg, _PHASE[codes].sum(axis=1))
+
+
+# taperedEval + pawnStructure of every position, ChessEngine.evaluate without the mobility term
+def batchEvaluate(positions):
+    codes = pieceCodes(positions)
+    return batchTapered(codes) + batchPawnStructure(codes)
@@ -0,0 +1,141 @@
+"""
+Bitboard tables and helpers.
+A bitboard is a python int using 64 bits, bit i is square i.
+Square i is row i // 8, col i % 8, so row 0 is the 8th rank like GameState.board.
+"""
+
+FULL = (1 << 64) - 1
+FILE_A = 0x0101010101010101
+FILE_H = FILE_A << 7
+ROWS = [0xFF << (8 * row) for row in range(8)]
+FILES = [FILE_A << col for col in range(8)]
+
+# (row step, col step) -- the first four slide like a rook, the last four like a bishop
+DIRECTIONS = ((-1, 0), (1, 0), (0, -1), (0, 1), (-1, -1), (-1, 1), (1, -1), (1, 1))
+ROOK_DIRECTIONS = (0, 1, 2, 3)
+BISHOP_DIRECTIONS = (4, 5, 6, 7)
+
+
+def lsb(bitboard):
+    return (bitboard & -bitboard).bit_length() - 1
+
+
+def msb(bitboard):
+    return bitboard.bit_length() - 1
+
+
+def popCount(bitboard):
+    return bitboard.bit_count()
+
+
+def squares(bitboard):
+    # yield every set square, lowest first
+    while bitboard:
+        low = bitboard & -bitboard
+        yield low.bit_length() - 1
+        bitboard ^= low
+
+
+def _stepAttacks(steps):
+    table = []
+    for sq in range(64):
+        row, col = sq >> 3, sq & 7
+        attacks = 0
+        for dr, dc in steps:
+            if 0 <= row + dr <= 7 and 0 <= col + dc <= 7:
+                attacks |= 1 << ((row + dr) * 8 + col + dc)
+        table.append(attacks)
+    return table
+
+
+KNIGHT_ATTACKS = _stepAttacks(((1, 2), (1, -2), (-1, 2), (-1, -2), (2, 1), (2, -1), (-2, 1), (-2, -1)))
+KING_ATTACKS = _stepAttacks(DIRECTIONS)
+# PAWN_ATTACKS[0] for white pawns (moving up the board), PAWN_ATTACKS[1] for black
+PAWN_ATTACKS = [_stepAttacks(((-1, -1), (-1, 1))), _stepAttacks(((1, -1), (1, 1)))]
+
+
+def _rays():
+    rays = []
+    for dr, dc in DIRECTIONS:
+        table = []
+        for sq in range(64):
+            row, col = (sq >> 3) + dr, (sq & 7) + dc
+            ray = 0
+            while 0 <= row <= 7 and 0 <= col <= 7:
+                ray |= 1 << (row * 8 + col)
+                row, col = row + dr, col + dc
+            table.append(ray)
+        rays.append(table)
+    return rays
+
+
+RAYS = _rays()
+# rays towards higher square indexes stop at their lowest blocker, the others at their highest
+_POSITIVE = [dr * 8 + dc > 0 for dr, dc in DIRECTIONS]
+
+
+def _slide(sq, occupied, directions):
+    attacks = 0
+    for d in directions:
+        ray = RAYS[d][sq]
+        blockers = ray & occupied
+        if blockers:
+            blocker = lsb(blockers) if _POSITIVE[d] else msb(blockers)
+            ray ^= RAYS[d][blocker]
+        attacks |= ray
+    return attacks
+
+
+def _relevantMask(directions):
+    # the last square of a ray never blocks anything, so it is left out of the lookup key
+    masks = []
+    for sq in range(64):
+        mask = 0
+        for d in directions:
+            ray = RAYS[d][sq]
+            if ray:
+                end = lsb(ray) if not _POSITIVE[d] else msb(ray)
+                mask |= ray & ~(1 << end)
+        masks.append(mask)
+    return masks
+
+
+ROOK_MASKS = _relevantMask(ROOK_DIRECTIONS)
+BISHOP_MASKS = _relevantMask(BISHOP_DIRECTIONS)
+# slider attacks keyed by the relevant occupancy, filled lazily so importing stays cheap
+_rookTable = [{} for _ in range(64)]
+_bishopTable = [{} for _ in range(64)]
+
+
+def rookAttacks(sq, occupied):
+    key = occupied & ROOK_MASKS[sq]
+    attacks = _rookTable[sq].get(key)
+    if attacks is None:
+        attacks = _rookTable[sq][key] = _slide(sq, key, ROOK_DIRECTIONS)
+    return attacks
+
+
+def bishopAttacks(sq, occupied):
+    key = occupied & BISHOP_MASKS[sq]
+    attacks = _bishopTable[sq].get(key)
+    if attacks is None:
+        attacks = _bishopTable[sq][key] = _slide(sq, key, BISHOP_DIRECTIONS)
+    return attacks
+
+
+def queenAttacks(sq, occupied):
+    return rookAttacks(sq, occupied) | bishopAttacks(sq, occupied)
+
+
+def _between():
+    # BETWEEN[a][b]: squares strictly between a and b when they share a line, 0 otherwise
+    table = [[0] * 64 for _ in range(64)]
+    for d in range(8):
+        for sq in range(64):
+            ray = RAYS[d][sq]
+            for target in squares(ray):
+                table[sq][target] = ray & ~RAYS[d][target] & ~(1 << target)
+    return table
+
+
+BETWEEN = _between()
@@ -1,56 +1,25 @@
-MAX_GEN_MOVES = 32
+"""
+Opening book.
+The book file is a list of fixed-width records sorted by position key:
+    key     8 bytes  GameState.zobristKey of the position
+    move    4 bytes  move code of the book move, only the squares and promotion bits (MOVE_KEY_MASK)
+    score   4 bytes  weight of the move, higher is played more often
+The file is memory-mapped and searched with a binary search, it is never read in whole.
+"""
 
-def GetBookMoves(pos, pbks):
-    nMoves = 0
-    posScan = pos
-    lpbks = []
-    Book = BookDataStruct(pbks)
-    bk = pbks
-    for nScan in range(3):
-        nPtr = nLow = 0
-        nHigh = Book.nLen - 1
-        while nLow <= nHigh:
-            nPtr = (nLow + nHigh) // 2
-            Book.Read(bk, nPtr)
-            if BOOK_POS_CMP(bk, posScan) < 0:
-                nLow = nPtr + 1
-            elif BOOK_POS_CMP(bk, posScan) > 0:
-                nHigh = nPtr - 1
-            else:
-                break
-        if nLow <= nHigh:
-            break
-        pos.Mirror(posScan)
-        if nScan == 2:
-            return 0
+import mmap
+import os
+import random
+import struct
 
-    while nPtr>=0:
-        Book.Read(bk)
-        if BOOK_POS_CMP(bk, posScan) < 0:
-            break
-        nPtr -=1
-    nMoves = 0
+from shallowBlue import ChessEngine
+from shallowBlue import Pgn
 
-    while nPtr < Book.nLen:
-        Book.Read(bk)
-        if BOOK_POS_CMP(bk, posScan) > 0:
-            break
-
-        if posScan.LegalMove(bk.wmv):
-            lpbks[nMoves].nPtr = nPtr
-            lpbks[nMoves].wmv = nScan if bk.wmv else bk.wmv
-            lpbks[nMoves].wvl = bk.wvl
-            nMoves+=1
-            if nMoves == MAX_GEN_MOVES:
-                break
+MAX_GEN_MOVES = 32
+RECORD = struct.Struct("<QIi")
+# book weight of a game move by game result, from the point of view of the side playing it
+RESULT_WEIGHTS = {"1-0": (2, 0), "0-1": (0, 2), "1/2-1/2": (1, 1), "*": (1, 1)}
 
-    for i in range(nMoves):
-        for j in range(i+1,nMoves,-1):
-            if lpbks[j - 1].wvl < lpbks[j].wvl:
-                temp = lpbks[j - 1]
-                lpbks[j - 1] = lpbks[j]
-                lpbks[j] = temp
-    return nMoves
 
 class Book:
     def __init__(self, key, move, score):
@@ -60,17 +29,100 @@ class Book:
 
 
 def BOOK_POS_CMP(bk, pos):
-    if bk.dwZobristLock < pos.zobr.dwLock1:
+    if bk.key < pos:
         return -1
-    if bk.dwZobristLock > pos.zobr.dwLock1:
+    if bk.key > pos:
         return 1
     return 0
 
 
 class BookDataStruct:
-    def __init__(self,bf):
-        self.nLen = 12081
-        self.bookBuffer = bf
+    def __init__(self, path):
+        self.file = open(path, "rb")
+        size = os.fstat(self.file.fileno()).st_size
+        self.nLen = size // RECORD.size
+        # mmap refuses empty files, an empty book simply has no records
+        self.bookBuffer = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if self.nLen else None
 
     def Read(self, nPtr):
-        return self[nPtr]
+        return Book(*RECORD.unpack_from(self.bookBuffer, nPtr * RECORD.size))
+
+    def close(self):
+        if self.bookBuffer is not None:
+            self.bookBuffer.close()
+        self.file.close()
+
+    # index of the first record with a key >= key
+    def lowerBound(self, key):
+        nLow, nHigh = 0, self.nLen
+        while nLow < nHigh:
+            nPtr = (nLow + nHigh) // 2
+            if BOOK_POS_CMP(self.Read(nPtr), key) < 0:
+                nLow = nPtr + 1
+            else:
+                nHigh = nPtr
+        return nLow
+
+
+# legal book moves for the position as Book records (move is a full move code), highest score first
+# a position missing from the book is looked up again with colours swapped, see mirroredZobristKey
+def GetBookMoves(pos, book):
+    legal = {code & ChessEngine.MOVE_KEY_MASK: code for code in pos.getValidMoveCodes()}
+    lpbks = []
+    for mirror in (False, True):
+        key = pos.mirroredZobristKey() if mirror else pos.zobristKey
+        nPtr = book.lowerBound(key)
+        while nPtr < book.nLen:
+            bk = book.Read(nPtr)
+            if BOOK_POS_CMP(bk, key) > 0:
+                break
+            move = _mirrorMove(bk.move) if mirror else bk.move
+            # a zobrist collision can bring moves from another position, only keep legal ones
+            if move in legal and bk.score > 0:
+                lpbks.append(Book(pos.zobristKey, legal[move], bk.score))
+                if len(lpbks) == MAX_GEN_MOVES:
+                    break
+            nPtr += 1
+        if lpbks:
+            break
+    lpbks.sort(key=lambda bk: bk.score, reverse=True)
+    return lpbks
+
+
+# a book move picked at random in proportion to its score, None if the position is not in the book
+def ChooseBookMove(pos, book, rng=random):
+    lpbks = GetBookMoves(pos, book)
+    if not lpbks:
+        return None
+    pick = rng.randrange(sum(bk.score for bk in lpbks))
+    for bk in lpbks:
+        pick -= bk.score
+        if pick < 0:
+            return ChessEngine.Move.fromCode(bk.move)
+    return ChessEngine.Move.fromCode(lpbks[0].move)
+
+
+def _mirrorMove(move):
+    return move & ~0xFFF | ((move & 63) ^ 56) | (((move >> 6 & 63) ^ 56) << 6)
+
+
+# write a book from a PGN file: every move of the first maxPly plies of every game,
+# weighted by the results it scored; moves with a total weight below minScore are left out
+def BuildBook(pgnPath, bookPath, maxPly=30, minScore=1):
+    scores = {}
+    for game in Pgn.readGames(pgnPath):
+        weights = RESULT_WEIGHTS[game.result]
+        pos = ChessEngine.GameState(game.startFen())
+        for ply, san in enumerate(game.sans[:maxPly]):
+            try:
+                move = pos.parseSan(san)
+            except ValueError:
+                break
+            entry = (pos.zobristKey, move & ChessEngine.MOVE_KEY_MASK)
+            scores[entry] = scores.get(entry, 0) + weights[0 if pos.whiteToMove else 1]
+            pos.makeMove(move)
+    records = sorted((key, move, score) for (key, move), score in scores.items() if score >= minScore)
+    with open(bookPath, "wb") as f:
+        for key, move, score in records:
+            f.write(RECORD.pack(key, move, min(score, 0x7FFFFFFF)))
+    return len(records)
@@ -3,163 +3,677 @@ Describe a chess state.
 Determine current legal move.
 """
 
-import numpy as np
+import random
+
+from shallowBlue import Bitboards as bb
+from shallowBlue import Evaluation as ev
+from shallowBlue import Transposition
+
+# piece codes index GameState.pieceBB, the colour of a piece is code // 6
+PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING = range(6)
+WHITE, BLACK = 0, 1
+EMPTY = 12
+PIECE_NAMES = ["wP", "wN", "wB", "wR", "wQ", "wK", "bP", "bN", "bB", "bR", "bQ", "bK", "ES"]
+PIECE_CODES = {name: code for code, name in enumerate(PIECE_NAMES)}
+SIGNED_CODES = [1, 2, 3, 4, 5, 6, -1, -2, -3, -4, -5, -6, 0]  # by piece code
+
+# a move is packed into one int:
+# bits 0-5 start square, 6-11 end square, 12-15 moving piece, 16-19 captured piece (EMPTY if none),
+# 20-22 flags, 23-25 piece type a pawn promotes to
+FLAG_EN_PASSANT, FLAG_CASTLING, FLAG_PROMOTION = 1, 2, 4
+PROMOTION_LETTERS = "PNBRQK"
+MOVE_KEY_MASK = 0xFFF | 7 << 23  # the bits the player chooses: squares and promotion piece
+
+
+def encodeMove(sq0, sq1, piece, captured, flags=0, promotion=0):
+    return sq0 | sq1 << 6 | piece << 12 | captured << 16 | flags << 20 | promotion << 23
+
+
+def isCaptureOrPromotion(code):
+    return code >> 16 & 15 != EMPTY or code >> 20 & FLAG_PROMOTION
+
+
+# zobrist keys, fixed seed so a position always hashes to the same 64-bit key
+_zobristRandom = random.Random(20200601)
+ZOBRIST_PIECES = [[_zobristRandom.getrandbits(64) for sq in range(64)] for piece in range(12)]
+ZOBRIST_SIDE = _zobristRandom.getrandbits(64)  # xored in when black is to move
+ZOBRIST_CASTLE = [_zobristRandom.getrandbits(64) for rights in range(16)]  # indexed by CastleRights.index()
+ZOBRIST_EN_PASSANT = [_zobristRandom.getrandbits(64) for col in range(8)]
+# the pawn and king part of the piece keys, GameState.pawnKingKey hashes only the pawn structure and kings
+ZOBRIST_PAWN_KING = [[ZOBRIST_PIECES[piece][sq] if piece % 6 in (PAWN, KING) else 0 for sq in range(64)]
+                     for piece in range(12)]
+
+MOVE_CACHE_SIZE = 4096  # positions whose legal moves a GameState remembers, see getValidMoveCodes
+START_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+FEN_PIECES = {"P": PAWN, "N": KNIGHT, "B": BISHOP, "R": ROOK, "Q": QUEEN, "K": KING,
+              "p": BLACK * 6 + PAWN, "n": BLACK * 6 + KNIGHT, "b": BLACK * 6 + BISHOP,
+              "r": BLACK * 6 + ROOK, "q": BLACK * 6 + QUEEN, "k": BLACK * 6 + KING}
+FEN_LETTERS = {code: letter for letter, code in FEN_PIECES.items()}
 
 
 class GameState:
-    def __init__(self):
-        # main chess board
-        self.board = np.array([["bR", "bN", "bB", "bQ", "bK", "bB", "bN", "bR"],
-                               ["bP", "bP", "bP", "bP", "bP", "bP", "bP", "bP"]])
-        self.board = np.vstack((self.board, np.full((4, 8), "ES")))
-        self.board = np.vstack((self.board, np.array(
-            [["wP", "wP", "wP", "wP", "wP", "wP", "wP", "wP"],
-             ["wR", "wN", "wB", "wQ", "wK", "wB", "wN", "wR"]])))
-        # pawn structure
-        self.WPawnKing = np.zeros((8, 8))
-        self.WPawnKing[6] = [1, 1, 1, 1, 1, 1, 1, 1]
-        self.WPawnKing[7][4] = -1
-        self.BPawnKing = np.zeros((8, 8))
-        self.BPawnKing[1] = [1, 1, 1, 1, 1, 1, 1, 1]
-        self.BPawnKing[0][4] = -1
-
-        # example: wN: white kNight, bK: black King, ES: Empty Space
-
-        self.moveLog = []
-        self.whiteToMove = True
+    # moveCacheSize 0 turns the legal move cache off, e.g. to time the move generator itself
+    def __init__(self, fen=START_FEN, moveCacheSize=MOVE_CACHE_SIZE):
         self.moveFunctions = {"R": self.getRookMoves,
                               "N": self.getKnightMoves,
                               "B": self.getBishopMoves,
                               "Q": self.getQueenMoves,
                               "K": self.getKingMoves,
                               "P": self.getPawnMoves, }
-        self.whiteKingLocation = (7, 4)
-        self.blackKingLocation = (0, 4)
+        # (moves, checkmate, stalemate, checks, pins) by zobristKey, the key covers everything legality depends on
+        self.moveCache = Transposition.LruCache(moveCacheSize) if moveCacheSize else None
+        self.loadFen(fen)
+
+    # set up the position described by a FEN string, forgetting the move history
+    def loadFen(self, fen):
+        fields = fen.split()
+        if len(fields) < 4:
+            raise ValueError("FEN needs at least 4 fields: " + fen)
+        self.startFen = fen  # with moveLog this rebuilds the game, e.g. in another process
+        # one bitboard per piece code, plus the occupancy of each colour
+        self.pieceBB = [0] * 12
+        self.colorBB = [0, 0]
+        self.occupied = 0
+        # piece code of every square, EMPTY if nothing is there
+        self.squares = [EMPTY] * 64
+        self.board = BoardView(self.squares)
+        self.zobristKey = 0
+        self.pawnKingKey = 0
+        # evaluation terms kept up to date by every piece change, white minus black
+        self.materialScore = 0  # in pawns, see materialBalance
+        self.mgScore = 0  # middlegame and endgame piece-square scores, see taperedEval
+        self.egScore = 0
+        self.phase = 0
+        rows = fields[0].split("/")
+        if len(rows) != 8:
+            raise ValueError("FEN board needs 8 rows: " + fields[0])
+        for row in range(8):
+            col = 0
+            for char in rows[row]:
+                if char.isdigit():
+                    col += int(char)
+                elif char in FEN_PIECES and col < 8:
+                    self._putPiece(FEN_PIECES[char], row * 8 + col)
+                    col += 1
+                else:
+                    raise ValueError("bad FEN row: " + rows[row])
+            if col != 8:
+                raise ValueError("bad FEN row: " + rows[row])
+        if bb.popCount(self.pieceBB[KING]) != 1 or bb.popCount(self.pieceBB[BLACK * 6 + KING]) != 1:
+            raise ValueError("FEN needs one king per side: " + fields[0])
+
+        self.moveLog = []  # move codes, Move.fromCode turns them back into Move objects
+        if fields[1] not in ("w", "b"):
+            raise ValueError("FEN side to move must be w or b: " + fields[1])
+        self.whiteToMove = fields[1] == "w"
+        if not self.whiteToMove:
+            self.zobristKey ^= ZOBRIST_SIDE
         self.checkmate = True  # king's in check && no valid moves
         self.stalemate = True  # king's not in check && no valid moves
         self.pins = []
         self.checks = []
-        self.enPassantGrid = ()  # store the square where en passant is possible
+        # store the square where en passant is possible
+        if fields[3] == "-":
+            self.enPassantGrid = ()
+        elif len(fields[3]) != 2 or fields[3][0] not in "abcdefgh" or \
+                fields[3][1] != ("6" if self.whiteToMove else "3"):
+            raise ValueError("bad FEN en passant square: " + fields[3])
+        else:
+            self.enPassantGrid = (Move.ranksToRows[fields[3][1]], Move.filesToCols[fields[3][0]])
+            # the pawn that just moved two squares stands in front of it, and the squares it crossed are empty
+            target = self.enPassantGrid[0] * 8 + self.enPassantGrid[1]
+            step = 8 if self.whiteToMove else -8
+            pusher = (BLACK if self.whiteToMove else WHITE) * 6 + PAWN
+            if self.squares[target + step] != pusher or self.squares[target] != EMPTY or \
+                    self.squares[target - step] != EMPTY:
+                raise ValueError("no pawn just moved past the FEN en passant square: " + fields[3])
+        self.zobristKey ^= self.enPassantKey()
+        self.enPassantLog = [self.enPassantGrid]
+
+        # CastleRights objects are never modified once logged, a move that changes them makes a new one
+        if fields[2] != "-" and (not fields[2] or set(fields[2]) - set("KQkq")):
+            raise ValueError("bad FEN castling rights: " + fields[2])
+        # a right needs its king and rook on their home squares
+        for letter, king, rook, kingSq, rookSq in (("K", KING, ROOK, 60, 63), ("Q", KING, ROOK, 60, 56),
+                                                   ("k", BLACK * 6 + KING, BLACK * 6 + ROOK, 4, 7),
+                                                   ("q", BLACK * 6 + KING, BLACK * 6 + ROOK, 4, 0)):
+            if letter in fields[2] and (self.squares[kingSq] != king or self.squares[rookSq] != rook):
+                raise ValueError("FEN castling right %s without its king and rook at home: %s" % (letter, fen))
+        self.currentCastle = CastleRights("K" in fields[2], "Q" in fields[2], "k" in fields[2], "q" in fields[2])
+        self.castleLog = [self.currentCastle]
+        self.zobristKey ^= ZOBRIST_CASTLE[self.currentCastle.index()]
+        self.zobristLog = [self.zobristKey]
+        # plies since the last capture or pawn move, for the fifty-move rule and the repetition window
+        try:
+            self.halfmoveClock = int(fields[4]) if len(fields) > 4 else 0
+            self.startFullmove = int(fields[5]) if len(fields) > 5 else 1
+        except ValueError:
+            raise ValueError("bad FEN move counters: " + fen)
+        self.halfmoveLog = [self.halfmoveClock]
+
+    # the NumPy exports import numpy when first called, the engine itself never needs it
+    # piece code of every square as an int8 array, the (N, 64) rows of the BatchEvaluation functions
+    def toArray(self):
+        import numpy as np
+        return np.array(self.squares, dtype=np.int8)
+
+    # 8x8 int8 board: 0 for an empty square, 1 to 6 for a white pawn to king, -1 to -6 for black
+    def toSignedBoard(self):
+        import numpy as np
+        return np.array([SIGNED_CODES[piece] for piece in self.squares], dtype=np.int8).reshape((8, 8))
+
+    # one 8x8 0/1 plane per piece code, the (N, 12, 8, 8) rows of the BatchEvaluation functions
+    def toPlanes(self):
+        import numpy as np
+        planes = np.zeros((12, 64), dtype=np.int8)
+        for piece in range(12):
+            for sq in bb.squares(self.pieceBB[piece]):
+                planes[piece, sq] = 1
+        return planes.reshape((12, 8, 8))
+
+    # pawn structure: 1 for a pawn, -1 for the king
+    @property
+    def WPawnKing(self):
+        return self.pawnKingMatrix(WHITE)
 
-        self.currentCastle = CastleRights(True, True, True, True)
-        self.castleLog = [self.currentCastle.makeCopy()]
+    @property
+    def BPawnKing(self):
+        return self.pawnKingMatrix(BLACK)
+
+    def pawnKingMatrix(self, color):
+        import numpy as np
+        matrix = np.zeros(64)
+        for sq in bb.squares(self.pieceBB[color * 6 + PAWN]):
+            matrix[sq] = 1
+        matrix[bb.lsb(self.pieceBB[color * 6 + KING])] = -1
+        return matrix.reshape((8, 8))
+
+    @property
+    def whiteKingLocation(self):
+        sq = bb.lsb(self.pieceBB[KING])
+        return sq >> 3, sq & 7
+
+    @property
+    def blackKingLocation(self):
+        sq = bb.lsb(self.pieceBB[BLACK * 6 + KING])
+        return sq >> 3, sq & 7
 
     def getTurn(self):
         if self.whiteToMove:
             return "w"
         return "b"
 
+    # an independent GameState with the same start position and moves, e.g. for a search in another thread
+    def copy(self):
+        gameState = GameState(self.startFen)
+        for move in self.moveLog:
+            gameState.makeMove(move)
+        return gameState
+
+    # the FEN move number, it goes up after every black move
+    @property
+    def fullmoveNumber(self):
+        whiteStarted = self.whiteToMove == (len(self.moveLog) % 2 == 0)
+        return self.startFullmove + (len(self.moveLog) + (0 if whiteStarted else 1)) // 2
+
+    # the position as a FEN string, loadFen reads it back to the same position
+    def toFen(self):
+        rows = []
+        for row in range(8):
+            text = ""
+            empty = 0
+            for piece in self.squares[row * 8:row * 8 + 8]:
+                if piece == EMPTY:
+                    empty += 1
+                    continue
+                if empty:
+                    text += str(empty)
+                    empty = 0
+                text += FEN_LETTERS[piece]
+            rows.append(text + (str(empty) if empty else ""))
+        if self.enPassantGrid:
+            enPassant = Move.colsToFiles[self.enPassantGrid[1]] + Move.rowsToRanks[self.enPassantGrid[0]]
+        else:
+            enPassant = "-"
+        return "%s %s %s %s %d %d" % ("/".join(rows), self.getTurn(), self.currentCastle.toFen(), enPassant,
+                                      self.halfmoveClock, self.fullmoveNumber)
+
+    def _putPiece(self, piece, sq):
+        bit = 1 << sq
+        self.pieceBB[piece] |= bit
+        self.colorBB[piece // 6] |= bit
+        self.occupied |= bit
+        self.squares[sq] = piece
+        self.zobristKey ^= ZOBRIST_PIECES[piece][sq]
+        self.pawnKingKey ^= ZOBRIST_PAWN_KING[piece][sq]
+        self.materialScore += ev.MATERIAL[piece]
+        self.mgScore += ev.MG_TABLE[piece][sq]
+        self.egScore += ev.EG_TABLE[piece][sq]
+        self.phase += ev.PHASE_WEIGHT[piece]
+
+    def _removePiece(self, piece, sq):
+        bit = 1 << sq
+        self.pieceBB[piece] ^= bit
+        self.colorBB[piece // 6] ^= bit
+        self.occupied ^= bit
+        self.squares[sq] = EMPTY
+        self.zobristKey ^= ZOBRIST_PIECES[piece][sq]
+        self.pawnKingKey ^= ZOBRIST_PAWN_KING[piece][sq]
+        self.materialScore -= ev.MATERIAL[piece]
+        self.mgScore -= ev.MG_TABLE[piece][sq]
+        self.egScore -= ev.EG_TABLE[piece][sq]
+        self.phase -= ev.PHASE_WEIGHT[piece]
+
+    def _movePiece(self, piece, sq0, sq1):
+        bits = (1 << sq0) | (1 << sq1)
+        self.pieceBB[piece] ^= bits
+        self.colorBB[piece // 6] ^= bits
+        self.occupied ^= bits
+        self.squares[sq0] = EMPTY
+        self.squares[sq1] = piece
+        self.zobristKey ^= ZOBRIST_PIECES[piece][sq0] ^ ZOBRIST_PIECES[piece][sq1]
+        self.pawnKingKey ^= ZOBRIST_PAWN_KING[piece][sq0] ^ ZOBRIST_PAWN_KING[piece][sq1]
+        self.mgScore += ev.MG_TABLE[piece][sq1] - ev.MG_TABLE[piece][sq0]
+        self.egScore += ev.EG_TABLE[piece][sq1] - ev.EG_TABLE[piece][sq0]
+
+    # move is a Move or a move code
     def makeMove(self, move):
-        self.board[move.row0][move.col0] = "ES"
-        self.board[move.row1][move.col1] = move.pieceToMove
-        # update kings location
-        if move.pieceToMove == "wK":
-            self.whiteKingLocation = (move.row1, move.col1)
-            self.WPawnKing[move.row0][move.col0] = 0
-            self.WPawnKing[move.row1][move.col1] = -1
-        elif move.pieceToMove == "bK":
-            self.blackKingLocation = (move.row1, move.col1)
-            self.BPawnKing[move.row0][move.col0] = 0
-            self.BPawnKing[move.row1][move.col1] = -1
-        self.moveLog.append(move)
-        self.whiteToMove = not self.whiteToMove
-        # update pawn structure
-        if move.pieceToMove == "wP":
-            self.WPawnKing[move.row0][move.col0] = 0
-            self.WPawnKing[move.row1][move.col1] = 1
-        elif move.pieceToMove == "bP":
-            self.BPawnKing[move.row0][move.col0] = 0
-            self.BPawnKing[move.row1][move.col1] = 1
+        if move.__class__ is not int:
+            move = move.code
+        sq0 = move & 63
+        sq1 = move >> 6 & 63
+        piece = move >> 12 & 15
+        captured = move >> 16 & 15
+        flags = move >> 20
+        # the old en passant key depends on the pawns before the move
+        self.zobristKey ^= self.enPassantKey()
+        # if enpassant: the captured pawn stands next to the start square
+        if flags & FLAG_EN_PASSANT:
+            self._removePiece(captured, (sq0 & ~7) | (sq1 & 7))
+        elif captured != EMPTY:
+            self._removePiece(captured, sq1)
+        self._movePiece(piece, sq0, sq1)
         # if pawn promotion:
-        if move.isPawnPromotion:
-            if move.promotionChoice == "Q":
-                self.board[move.row1][move.col1] = move.pieceToMove[0] + "Q"
-        # if enpassant:
-        if move.isEnPassantMove:
-            self.board[move.row0][move.col1] = "ES"
-        # if the move is 2-step pawn advance: enpassant possible
-        if move.pieceToMove[1] == "P" and abs(move.row1 - move.row0) == 2:
-            self.enPassantGrid = ((move.row1 + move.row0) // 2, move.col0)
-        else:
-            self.enPassantGrid = ()  # only valid for one step
+        if flags & FLAG_PROMOTION:
+            self._removePiece(piece, sq1)
+            self._putPiece(piece - PAWN + (flags >> 3), sq1)
         # if castling
-        if move.isCastling:
+        if flags & FLAG_CASTLING:
+            rook = piece - KING + ROOK
             # if move rightward -- king side castle
-            if move.col1 - move.col0 == 2:
-                self.board[move.row1][move.col1 - 1] = self.board[move.row1][move.col1 + 1]
-                self.board[move.row1][move.col1 + 1] = "ES"
+            if sq1 - sq0 == 2:
+                self._movePiece(rook, sq1 + 1, sq1 - 1)
             # else queen side castle
             else:
-                self.board[move.row1][move.col1 + 1] = self.board[move.row1][move.col1 - 2]
-                self.board[move.row1][move.col1 - 2] = "ES"
-        # update castling rights
-        if move.pieceToMove == "wK":
-            self.currentCastle.wks = False
-            self.currentCastle.wqs = False
-        elif move.pieceToMove == "bK":
-            self.currentCastle.bks = False
-            self.currentCastle.bqs = False
-        elif move.pieceToMove == "wR":
-            if self.currentCastle.wqs == True or self.currentCastle.wks == True:
-                if move.row0 == 7:
-                    if move.col0 == 0:
-                        self.currentCastle.wqs = False
-                    elif move.col0 == 7:
-                        self.currentCastle.wks = False
-        elif move.pieceToMove == "bR":
-            if self.currentCastle.bqs == True or self.currentCastle.bks == True:
-                if move.row0 == 0:
-                    if move.col0 == 0:
-                        self.currentCastle.bqs = False
-                    elif move.col0 == 7:
-                        self.currentCastle.bks = False
-        self.castleLog.append(CastleRights(wks=self.currentCastle.wks, wqs=self.currentCastle.wqs,
-                                           bks=self.currentCastle.bks, bqs=self.currentCastle.bqs))
+                self._movePiece(rook, sq1 - 2, sq1 + 1)
+        self.moveLog.append(move)
+        self.whiteToMove = not self.whiteToMove
+        self.zobristKey ^= ZOBRIST_SIDE
+        # if the move is 2-step pawn advance: enpassant possible
+        if piece % 6 == PAWN and abs(sq1 - sq0) == 16:
+            self.enPassantGrid = ((sq0 + sq1) >> 4, sq0 & 7)
+            self.zobristKey ^= self.enPassantKey()
+        else:
+            self.enPassantGrid = ()  # only valid for one step
+        self.enPassantLog.append(self.enPassantGrid)
+        # update castling rights: moving the king or a rook, or capturing a rook, loses them
+        castle = self.currentCastle
+        if castle.wks or castle.wqs or castle.bks or castle.bqs:
+            wks = castle.wks and sq0 != 60 and sq0 != 63 and sq1 != 63
+            wqs = castle.wqs and sq0 != 60 and sq0 != 56 and sq1 != 56
+            bks = castle.bks and sq0 != 4 and sq0 != 7 and sq1 != 7
+            bqs = castle.bqs and sq0 != 4 and sq0 != 0 and sq1 != 0
+            if wks != castle.wks or wqs != castle.wqs or bks != castle.bks or bqs != castle.bqs:
+                self.currentCastle = CastleRights(wks=wks, wqs=wqs, bks=bks, bqs=bqs)
+                self.zobristKey ^= ZOBRIST_CASTLE[castle.index()] ^ ZOBRIST_CASTLE[self.currentCastle.index()]
+        self.castleLog.append(self.currentCastle)
+        self.zobristLog.append(self.zobristKey)
+        self.halfmoveClock = 0 if piece % 6 == PAWN or captured != EMPTY else self.halfmoveClock + 1
+        self.halfmoveLog.append(self.halfmoveClock)
 
     def undoMove(self):
         if len(self.moveLog) == 0:
             return
         else:
             move = self.moveLog.pop()
-            self.board[move.row0][move.col0] = move.pieceToMove
-            self.board[move.row1][move.col1] = move.pieceToCapture
-            # update kings location
-            if move.pieceToMove == "wK":
-                self.whiteKingLocation = (move.row0, move.col0)
-            elif move.pieceToMove == "bK":
-                if move.pieceToMove == "wK":
-                    self.blackKingLocation = (move.row0, move.col0)
-            self.whiteToMove = not self.whiteToMove
-            # undo en passant
-            if move.isEnPassantMove:
-                self.board[move.row1][move.col1] = "ES"
-                self.board[move.row0][move.col1] = move.pieceToCapture
-                self.enPassantGrid = (move.row1, move.col1)
-            # undo two-square pawn advance
-            if move.pieceToMove[1] == "P" and abs(move.row1 - move.row0) == 2:
-                self.enPassantGrid = ()
-            # undo the change of castle rights
-            self.castleLog.pop()
-            self.currentCastle = self.castleLog[-1]
+            sq0 = move & 63
+            sq1 = move >> 6 & 63
+            piece = move >> 12 & 15
+            captured = move >> 16 & 15
+            flags = move >> 20
             # undo the castle moves
-            if move.isCastling:
+            if flags & FLAG_CASTLING:
+                rook = piece - KING + ROOK
                 # if move rightward -- king side castle
-                if move.col1 - move.col0 == 2:
-                    self.board[move.row1][move.col1 + 1] = self.board[move.row1][move.col1 - 1]
-                    self.board[move.row1][move.col1 - 1] = "ES"
-
+                if sq1 - sq0 == 2:
+                    self._movePiece(rook, sq1 - 1, sq1 + 1)
                 # else queen side castle
                 else:
-                    self.board[move.row1][move.col1 - 2] = self.board[move.row1][move.col1 + 1]
-                    self.board[move.row1][move.col1 + 1] = "ES"
+                    self._movePiece(rook, sq1 + 1, sq1 - 2)
+            # undo pawn promotion
+            if flags & FLAG_PROMOTION:
+                self._removePiece(piece - PAWN + (flags >> 3), sq1)
+                self._putPiece(piece, sq1)
+            self._movePiece(piece, sq1, sq0)
+            # undo en passant
+            if flags & FLAG_EN_PASSANT:
+                self._putPiece(captured, (sq0 & ~7) | (sq1 & 7))
+            elif captured != EMPTY:
+                self._putPiece(captured, sq1)
+            self.whiteToMove = not self.whiteToMove
+            self.enPassantLog.pop()
+            self.enPassantGrid = self.enPassantLog[-1]
+            # undo the change of castle rights
+            self.castleLog.pop()
+            self.currentCastle = self.castleLog[-1]
+            # the piece updates above touched the key too, the logged key is the exact one
+            self.zobristLog.pop()
+            self.zobristKey = self.zobristLog[-1]
+            self.halfmoveLog.pop()
+            self.halfmoveClock = self.halfmoveLog[-1]
             self.checkmate = False
             self.stalemate = False
 
+    # whether the current position occurred at least times before, with the same side to move
+    # only the positions since the last capture or pawn move can repeat, so only those are looked at
+    def isRepetition(self, times=1):
+        log = self.zobristLog
+        key = self.zobristKey
+        count = 0
+        last = len(log) - 1
+        for i in range(last - 4, max(last - self.halfmoveClock, 0) - 1, -2):
+            if log[i] == key:
+                count += 1
+                if count >= times:
+                    return True
+        return False
+
+    # "fifty-move rule", "threefold repetition" or None; checkmate on the last move still wins,
+    # so call this after getValidMoves
+    def drawReason(self):
+        if self.checkmate:
+            return None
+        if self.halfmoveClock >= 100:
+            return "fifty-move rule"
+        if self.isRepetition(2):
+            return "threefold repetition"
+        return None
+
+    # hash the position from scratch, makeMove and undoMove keep zobristKey equal to this
+    def computeZobristKey(self):
+        key = 0
+        for sq in range(64):
+            if self.squares[sq] != EMPTY:
+                key ^= ZOBRIST_PIECES[self.squares[sq]][sq]
+        if not self.whiteToMove:
+            key ^= ZOBRIST_SIDE
+        key ^= self.enPassantKey()
+        return key ^ ZOBRIST_CASTLE[self.currentCastle.index()]
+
+    # the zobrist key of the en passant square, only there when a pawn of the side to move can take on it
+    # otherwise a double pawn push would make a position differ from the same one reached without it
+    def enPassantKey(self):
+        if not self.enPassantGrid:
+            return 0
+        color = WHITE if self.whiteToMove else BLACK
+        if bb.PAWN_ATTACKS[1 - color][self.enPassantGrid[0] * 8 + self.enPassantGrid[1]] & \
+                self.pieceBB[color * 6 + PAWN]:
+            return ZOBRIST_EN_PASSANT[self.enPassantGrid[1]]
+        return 0
+
+    def computePawnKingKey(self):
+        key = 0
+        for sq in range(64):
+            if self.squares[sq] != EMPTY:
+                key ^= ZOBRIST_PAWN_KING[self.squares[sq]][sq]
+        return key
+
+    # (materialScore, mgScore, egScore, phase) from scratch, the incremental values must match
+    def computeScores(self):
+        material = mg = eg = phase = 0
+        for sq in range(64):
+            piece = self.squares[sq]
+            if piece != EMPTY:
+                material += ev.MATERIAL[piece]
+                mg += ev.MG_TABLE[piece][sq]
+                eg += ev.EG_TABLE[piece][sq]
+                phase += ev.PHASE_WEIGHT[piece]
+        return material, mg, eg, phase
+
+    # key of the same position with the colours swapped and the board flipped top to bottom
+    # the side to move is swapped too, so both positions have the same best moves (mirrored)
+    def mirroredZobristKey(self):
+        key = 0
+        for sq in range(64):
+            if self.squares[sq] != EMPTY:
+                key ^= ZOBRIST_PIECES[(self.squares[sq] + 6) % 12][sq ^ 56]
+        if self.whiteToMove:
+            key ^= ZOBRIST_SIDE
+        # taking en passant is possible in both positions or in neither
+        key ^= self.enPassantKey()
+        castle = self.currentCastle
+        return key ^ ZOBRIST_CASTLE[CastleRights(castle.bks, castle.bqs, castle.wks, castle.wqs).index()]
+
+    # the legal move code for a move in standard algebraic notation, e.g. "Nbd7", "exd5", "e8=Q+", "O-O"
+    def parseSan(self, san):
+        san = san.rstrip("+#!?")
+        if san in ("O-O", "0-0", "O-O-O", "0-0-0"):
+            step = 2 if len(san) == 3 else -2
+            for move in self.getValidMoveCodes():
+                if move >> 20 & FLAG_CASTLING and (move >> 6 & 63) - (move & 63) == step:
+                    return move
+            raise ValueError("illegal castling: " + san)
+        promotion = 0
+        if "=" in san:
+            san, letter = san.split("=", 1)
+            promotion = PROMOTION_LETTERS.find(letter[:1].upper())
+        elif san[-1:] in ("Q", "R", "B", "N") and san[:1].islower():
+            san, promotion = san[:-1], PROMOTION_LETTERS.index(san[-1])
+        if len(san) < 2 or san[-2] not in Move.filesToCols or san[-1] not in Move.ranksToRows or \
+                not KNIGHT <= promotion <= QUEEN and promotion != 0:
+            raise ValueError("bad SAN move: " + san)
+        pieceType = PROMOTION_LETTERS.index(san[0]) if san[0] in "NBRQK" else PAWN
+        target = Move.ranksToRows[san[-1]] * 8 + Move.filesToCols[san[-2]]
+        hint = san[1 if pieceType != PAWN else 0:-2].replace("x", "")
+        # only the pieces that reach the target are looked at, instead of generating every legal move
+        color = WHITE if self.whiteToMove else BLACK
+        piece = color * 6 + pieceType
+        captured = self.squares[target]
+        if captured != EMPTY and captured // 6 == color:
+            raise ValueError("illegal SAN move: " + san)
+        flags = 0
+        if pieceType == PAWN:
+            step = -8 if color == WHITE else 8
+            # a pawn never reaches its own first rank and promotes exactly on the last one
+            row = target >> 3
+            if row == (7 if color == WHITE else 0) or (row == (0 if color == WHITE else 7)) != (promotion != 0):
+                raise ValueError("illegal SAN move: " + san)
+            if promotion:
+                flags = FLAG_PROMOTION
+            if hint:
+                origins = bb.PAWN_ATTACKS[1 - color][target] & self.pieceBB[piece]
+                if captured == EMPTY:
+                    if not self.enPassantGrid or target != self.enPassantGrid[0] * 8 + self.enPassantGrid[1]:
+                        raise ValueError("illegal SAN move: " + san)
+                    flags, captured = FLAG_EN_PASSANT, (1 - color) * 6 + PAWN
+            elif captured != EMPTY:
+                origins = 0
+            elif self.squares[target - step] == piece:
+                origins = 1 << (target - step)
+            elif row == (4 if color == WHITE else 3) and self.squares[target - step] == EMPTY and \
+                    self.squares[target - 2 * step] == piece:
+                origins = 1 << (target - 2 * step)
+            else:
+                origins = 0
+        elif pieceType == KNIGHT:
+            origins = bb.KNIGHT_ATTACKS[target] & self.pieceBB[piece]
+        elif pieceType == BISHOP:
+            origins = bb.bishopAttacks(target, self.occupied) & self.pieceBB[piece]
+        elif pieceType == ROOK:
+            origins = bb.rookAttacks(target, self.occupied) & self.pieceBB[piece]
+        elif pieceType == QUEEN:
+            origins = bb.queenAttacks(target, self.occupied) & self.pieceBB[piece]
+        else:
+            origins = bb.KING_ATTACKS[target] & self.pieceBB[piece]
+        candidates = []
+        for start in bb.squares(origins):
+            if all((c in Move.filesToCols and Move.filesToCols[c] == start & 7) or
+                   (c in Move.ranksToRows and Move.ranksToRows[c] == start >> 3) for c in hint):
+                move = encodeMove(start, target, piece, captured, flags, promotion)
+                if not self._leavesKingInCheck(move):
+                    candidates.append(move)
+        if len(candidates) != 1:
+            raise ValueError(("ambiguous" if candidates else "illegal") + " SAN move: " + san)
+        return candidates[0]
+
+    # whether a pseudo-legal move exposes the mover's own king
+    def _leavesKingInCheck(self, move):
+        color = WHITE if self.whiteToMove else BLACK
+        status = self.checkmate, self.stalemate
+        self.makeMove(move)
+        inCheck = self.attackersTo(bb.lsb(self.pieceBB[color * 6 + KING]), 1 - color, self.occupied) != 0
+        self.undoMove()
+        self.checkmate, self.stalemate = status
+        return inCheck
+
+    # the SAN of a legal move code in this position, e.g. "Nbd7", "exd6", "e8=Q+", "O-O#"
+    def toSan(self, move):
+        # move generation below overwrites these, the caller still sees them as they were
+        status = self.checkmate, self.stalemate, self.pins, self.checks
+        sq0 = move & 63
+        sq1 = move >> 6 & 63
+        pieceType = (move >> 12 & 15) % 6
+        flags = move >> 20 & 7
+        if flags & FLAG_CASTLING:
+            san = "O-O" if sq1 > sq0 else "O-O-O"
+        else:
+            target = Move.colsToFiles[sq1 & 7] + Move.rowsToRanks[sq1 >> 3]
+            capture = move >> 16 & 15 != EMPTY
+            if pieceType == PAWN:
+                san = (Move.colsToFiles[sq0 & 7] + "x" if capture else "") + target
+                if flags & FLAG_PROMOTION:
+                    san += "=" + PROMOTION_LETTERS[move >> 23 & 7]
+            else:
+                # name the start file, rank or square when another piece of the same kind can go there too
+                others = [other & 63 for other in self.getValidMoveCodes()
+                          if other >> 6 & 63 == sq1 and other >> 12 & 15 == move >> 12 & 15 and other & 63 != sq0]
+                hint = ""
+                if others:
+                    if all(other & 7 != sq0 & 7 for other in others):
+                        hint = Move.colsToFiles[sq0 & 7]
+                    elif all(other >> 3 != sq0 >> 3 for other in others):
+                        hint = Move.rowsToRanks[sq0 >> 3]
+                    else:
+                        hint = Move.colsToFiles[sq0 & 7] + Move.rowsToRanks[sq0 >> 3]
+                san = PROMOTION_LETTERS[pieceType] + hint + ("x" if capture else "") + target
+        self.makeMove(move)
+        if self.inCheck():
+            san += "#" if not self.getValidMoveCodes() else "+"
+        self.undoMove()
+        self.checkmate, self.stalemate, self.pins, self.checks = status
+        return san
+
+    # a move code from UCI notation like "e2e4" or "e7e8q", ValueError if it is not legal here
+    def parseUci(self, uci):
+        for move in self.getValidMoveCodes():
+            if Move.fromCode(move).getUci() == uci:
+                return move
+        raise ValueError("illegal UCI move: " + uci)
+
     # generate all moves, cannot leave the king in check
     def getValidMoves(self):
+        return [Move.fromCode(code) for code in self.getValidMoveCodes()]
+
+    # the same moves as plain move codes, for the search where every allocation counts
+    # a position seen recently is answered from moveCache, with its checkmate and stalemate flags
+    def getValidMoveCodes(self):
+        if self.moveCache is None:
+            return self._generateMoveCodes()
+        entry = self.moveCache.probe(self.zobristKey)
+        if entry is not None:
+            moves, self.checkmate, self.stalemate, self.checks, self.pins = entry
+            return list(moves)
+        moves = self._generateMoveCodes()
+        self.moveCache.store(self.zobristKey, (tuple(moves), self.checkmate, self.stalemate, self.checks, self.pins))
+        return moves
+
+    # only the captures and promotions among the legal moves, for the quiescence search
+    # quiet moves are never generated; checkmate and stalemate are left as they were, no captures says nothing of them
+    def getCaptureCodes(self):
+        if self.moveCache is not None:
+            entry = self.moveCache.probe(self.zobristKey)
+            if entry is not None:
+                return [move for move in entry[0] if isCaptureOrPromotion(move)]
+        return self._generateMoveCodes(capturesOnly=True)
+
+    # pins and checks are found once, so every move it returns is already legal
+    # capturesOnly keeps to captures and promotions, and leaves checkmate and stalemate alone
+    def _generateMoveCodes(self, capturesOnly=False):
+        moves = []
+        color = WHITE if self.whiteToMove else BLACK
+        enemy = 1 - color
+        pieceBB = self.pieceBB
+        squares = self.squares
+        own = self.colorBB[color]
+        occupied = self.occupied
+        kingSq = bb.lsb(pieceBB[color * 6 + KING])
+        checkers = self.attackersTo(kingSq, enemy, occupied)
+        pinned, pinRays = self._pinnedPieces(kingSq, color)
+        self.checks = [(sq >> 3, sq & 7) for sq in bb.squares(checkers)]
+        self.pins = [(sq >> 3, sq & 7) for sq in bb.squares(pinned)]
+
+        # the king may not step onto an attacked square, even one behind it on a checking line
+        king = color * 6 + KING
+        withoutKing = occupied ^ (1 << kingSq)
+        targetMask = self.colorBB[enemy] if capturesOnly else ~own & bb.FULL
+        for target in bb.squares(bb.KING_ATTACKS[kingSq] & targetMask):
+            if not self.attackersTo(target, enemy, withoutKing):
+                moves.append(kingSq | target << 6 | king << 12 | squares[target] << 16)
+
+        if bb.popCount(checkers) < 2:
+            if checkers:
+                # capture the checking piece or block its line
+                evasions = checkers | bb.BETWEEN[kingSq][bb.lsb(checkers)]
+            else:
+                evasions = bb.FULL
+                if not capturesOnly:
+                    self._getLegalCastleMoves(kingSq, moves)
+            allowed = evasions & targetMask
+            # pawn pushes never capture, with capturesOnly only the promotions are kept
+            pushAllowed = evasions & (bb.ROWS[0] | bb.ROWS[7]) if capturesOnly else allowed
+            for piece in range(color * 6 + KNIGHT, color * 6 + KING):
+                for sq in bb.squares(pieceBB[piece]):
+                    if piece % 6 == KNIGHT:
+                        targets = bb.KNIGHT_ATTACKS[sq]
+                    elif piece % 6 == BISHOP:
+                        targets = bb.bishopAttacks(sq, occupied)
+                    elif piece % 6 == ROOK:
+                        targets = bb.rookAttacks(sq, occupied)
+                    else:
+                        targets = bb.queenAttacks(sq, occupied)
+                    targets &= allowed
+                    if pinned >> sq & 1:
+                        targets &= pinRays[sq]
+                    for target in bb.squares(targets):
+                        moves.append(sq | target << 6 | piece << 12 | squares[target] << 16)
+            self._getLegalPawnMoves(kingSq, allowed, pushAllowed, pinned, pinRays, moves)
+
+        if capturesOnly:
+            return moves
+        if len(moves) == 0:
+            if checkers:
+                self.checkmate = True
+            else:
+                self.stalemate = True
+        else:
+            self.checkmate = False
+            self.stalemate = False
+        return moves
+
+    # the original generator: make every possible move and drop those leaving the king in check
+    # much slower, kept as a reference to check getValidMoves against
+    def getValidMovesByFiltering(self):
         moves = self.getPossibleMoves(castle=True)
-        enpassantGrid = self.enPassantGrid
-        castlingPossible = self.currentCastle.makeCopy()
         # for each move make the move
         for i in range(len(moves) - 1, -1, -1):
             self.makeMove(moves[i])  # it's now opponent's turn
@@ -176,111 +690,239 @@ class GameState:
         else:
             self.checkmate = False
             self.stalemate = False
-        self.enPassantGrid = enpassantGrid
-        self.currentCastle = castlingPossible
         return moves
 
+    # pieces of color pinned to their king, and the line each of them may still move along
+    def _pinnedPieces(self, kingSq, color):
+        pieceBB = self.pieceBB
+        base = (1 - color) * 6
+        snipers = (bb.rookAttacks(kingSq, 0) & (pieceBB[base + ROOK] | pieceBB[base + QUEEN])) | \
+                  (bb.bishopAttacks(kingSq, 0) & (pieceBB[base + BISHOP] | pieceBB[base + QUEEN]))
+        pinned = 0
+        pinRays = {}
+        for sniper in bb.squares(snipers):
+            between = bb.BETWEEN[kingSq][sniper]
+            blockers = between & self.occupied
+            # exactly one piece in between and it is ours
+            if blockers and not blockers & (blockers - 1) and blockers & self.colorBB[color]:
+                pinned |= blockers
+                pinRays[bb.lsb(blockers)] = between | (1 << sniper)
+        return pinned, pinRays
+
+    def _getLegalPawnMoves(self, kingSq, allowed, pushAllowed, pinned, pinRays, moves):
+        if self.whiteToMove:
+            color, step, startRow = WHITE, -8, 6
+        else:
+            color, step, startRow = BLACK, 8, 1
+        piece = color * 6 + PAWN
+        enemyBB = self.colorBB[1 - color]
+        occupied = self.occupied
+        squares = self.squares
+        for sq in bb.squares(self.pieceBB[piece]):
+            targets = 0
+            one = sq + step
+            if not occupied >> one & 1:
+                targets |= 1 << one
+                if sq >> 3 == startRow and not occupied >> (one + step) & 1:
+                    targets |= 1 << (one + step)
+            targets &= pushAllowed
+            targets |= bb.PAWN_ATTACKS[color][sq] & enemyBB & allowed
+            if pinned >> sq & 1:
+                targets &= pinRays[sq]
+            for target in bb.squares(targets):
+                _addPawnMove(sq | target << 6 | piece << 12 | squares[target] << 16, target, moves)
+        if self.enPassantGrid:
+            target = self.enPassantGrid[0] * 8 + self.enPassantGrid[1]
+            captureSq = target - step
+            for sq in bb.squares(bb.PAWN_ATTACKS[1 - color][target] & self.pieceBB[piece]):
+                # both pawns leave the board at once, so test the king directly
+                after = occupied ^ (1 << sq) ^ (1 << captureSq) | (1 << target)
+                if not self.attackersTo(kingSq, 1 - color, after) & ~(1 << captureSq):
+                    moves.append(encodeMove(sq, target, piece, (1 - color) * 6 + PAWN, FLAG_EN_PASSANT))
+
+    def _getLegalCastleMoves(self, kingSq, moves):
+        if self.whiteToMove:
+            kingSide, queenSide, enemy = self.currentCastle.wks, self.currentCastle.wqs, BLACK
+        else:
+            kingSide, queenSide, enemy = self.currentCastle.bks, self.currentCastle.bqs, WHITE
+        occupied = self.occupied
+        king = self.squares[kingSq]
+        if kingSide and not occupied & ((1 << (kingSq + 1)) | (1 << (kingSq + 2))):
+            if not self.attackersTo(kingSq + 1, enemy, occupied) and \
+                    not self.attackersTo(kingSq + 2, enemy, occupied):
+                moves.append(encodeMove(kingSq, kingSq + 2, king, EMPTY, FLAG_CASTLING))
+        if queenSide and not occupied & ((1 << (kingSq - 1)) | (1 << (kingSq - 2)) | (1 << (kingSq - 3))):
+            if not self.attackersTo(kingSq - 1, enemy, occupied) and \
+                    not self.attackersTo(kingSq - 2, enemy, occupied):
+                moves.append(encodeMove(kingSq, kingSq - 2, king, EMPTY, FLAG_CASTLING))
+
     # determine if current player is in check
     def inCheck(self):
-        if self.whiteToMove:
-            return self.underAttack(self.whiteKingLocation[0], self.whiteKingLocation[1])
-        return self.underAttack(self.blackKingLocation[0], self.blackKingLocation[1])
+        color = WHITE if self.whiteToMove else BLACK
+        kingSq = bb.lsb(self.pieceBB[color * 6 + KING])
+        return self.attackersTo(kingSq, 1 - color, self.occupied) != 0
 
     # determine if current player's r-c square is under attack
     def underAttack(self, r, c):
-        self.whiteToMove = not self.whiteToMove
-        oppMoves = self.getPossibleMoves()  # moves that might attack the r-c grid
-        self.whiteToMove = not self.whiteToMove
-        for move in oppMoves:
-            if move.row1 == r and move.col1 == c:
-                return True
-        return False
+        enemy = BLACK if self.whiteToMove else WHITE
+        return self.attackersTo(r * 8 + c, enemy, self.occupied) != 0
+
+    # bitboard of the pieces of color attacking sq
+    # looks outward from sq for each piece type instead of generating the attacker's moves
+    def attackersTo(self, sq, color, occupied=None):
+        if occupied is None:
+            occupied = self.occupied
+        pieceBB = self.pieceBB
+        base = color * 6
+        return (bb.KNIGHT_ATTACKS[sq] & pieceBB[base + KNIGHT]) | \
+               (bb.PAWN_ATTACKS[1 - color][sq] & pieceBB[base + PAWN]) | \
+               (bb.KING_ATTACKS[sq] & pieceBB[base + KING]) | \
+               (bb.rookAttacks(sq, occupied) & (pieceBB[base + ROOK] | pieceBB[base + QUEEN])) | \
+               (bb.bishopAttacks(sq, occupied) & (pieceBB[base + BISHOP] | pieceBB[base + QUEEN]))
+
+    # static exchange evaluation of move: the material in centipawns the side to move ends up winning on its end
+    # square when both sides keep recapturing there with their least valuable piece, and stop once it stops paying
+    # works on the occupancy alone, no make/undo; pieces behind the ones taking part join in as they are uncovered
+    def see(self, move):
+        end = move >> 6 & 63
+        piece = move >> 12 & 15
+        captured = move >> 16 & 15
+        occupied = self.occupied ^ (1 << (move & 63))
+        value = ev.SEE_VALUE[piece % 6]  # of the piece standing on end, the next one to be taken
+        gain = [ev.SEE_VALUE[captured % 6] if captured != EMPTY else 0]
+        if move >> 20 & FLAG_PROMOTION:
+            value = ev.SEE_VALUE[move >> 23 & 7]
+            gain[0] += value - ev.SEE_VALUE[PAWN]
+        elif move >> 20 & FLAG_EN_PASSANT:
+            occupied ^= 1 << (end + 8 if piece == PAWN else end - 8)
+        pieceBB = self.pieceBB
+        color = piece // 6
+        while True:
+            color = 1 - color
+            attackers = self.attackersTo(end, color, occupied) & occupied
+            if not attackers:
+                break
+            for kind in range(PAWN, KING + 1):
+                attacker = attackers & pieceBB[color * 6 + kind]
+                if attacker:
+                    break
+            # the king may only take a piece nobody defends any more
+            if kind == KING and self.attackersTo(end, 1 - color, occupied) & occupied:
+                break
+            gain.append(value - gain[-1])
+            value = ev.SEE_VALUE[kind]
+            occupied ^= attacker & -attacker
+        # each side may also stop taking, back up from the last capture
+        while len(gain) > 1:
+            last = gain.pop()
+            gain[-1] = min(gain[-1], -last)
+        return gain[0]
+
+    # bitboard of every square attacked by color (defended squares included)
+    def attackedSquares(self, color, occupied=None):
+        if occupied is None:
+            occupied = self.occupied
+        pieceBB = self.pieceBB
+        base = color * 6
+        attacks = self.pawnAttacks(color)
+        for sq in bb.squares(pieceBB[base + KNIGHT]):
+            attacks |= bb.KNIGHT_ATTACKS[sq]
+        for sq in bb.squares(pieceBB[base + BISHOP] | pieceBB[base + QUEEN]):
+            attacks |= bb.bishopAttacks(sq, occupied)
+        for sq in bb.squares(pieceBB[base + ROOK] | pieceBB[base + QUEEN]):
+            attacks |= bb.rookAttacks(sq, occupied)
+        for sq in bb.squares(pieceBB[base + KING]):
+            attacks |= bb.KING_ATTACKS[sq]
+        return attacks
+
+    # squares attacked by the pawns of color
+    def pawnAttacks(self, color):
+        if color == WHITE:
+            pawns = self.pieceBB[PAWN]
+            return ((pawns >> 9) & ~bb.FILE_H) | ((pawns >> 7) & ~bb.FILE_A)
+        pawns = self.pieceBB[BLACK * 6 + PAWN]
+        return (((pawns << 7) & ~bb.FILE_H) | ((pawns << 9) & ~bb.FILE_A)) & bb.FULL
+
+    # weighted count of the squares the pieces of color attack, leaving out squares of their own pieces
+    # and, with safe, squares attacked by enemy pawns; pins and checks are ignored and nothing is changed
+    def mobilityScore(self, color, safe=True, weights=ev.MOBILITY_WEIGHT):
+        pieceBB = self.pieceBB
+        occupied = self.occupied
+        base = color * 6
+        targets = ~self.colorBB[color] & bb.FULL
+        if safe:
+            targets &= ~self.pawnAttacks(1 - color)
+        score = 0
+        if weights[KNIGHT]:
+            for sq in bb.squares(pieceBB[base + KNIGHT]):
+                score += weights[KNIGHT] * (bb.KNIGHT_ATTACKS[sq] & targets).bit_count()
+        if weights[BISHOP]:
+            for sq in bb.squares(pieceBB[base + BISHOP]):
+                score += weights[BISHOP] * (bb.bishopAttacks(sq, occupied) & targets).bit_count()
+        if weights[ROOK]:
+            for sq in bb.squares(pieceBB[base + ROOK]):
+                score += weights[ROOK] * (bb.rookAttacks(sq, occupied) & targets).bit_count()
+        if weights[QUEEN]:
+            for sq in bb.squares(pieceBB[base + QUEEN]):
+                score += weights[QUEEN] * (bb.queenAttacks(sq, occupied) & targets).bit_count()
+        if weights[KING]:
+            for sq in bb.squares(pieceBB[base + KING]):
+                score += weights[KING] * (bb.KING_ATTACKS[sq] & targets).bit_count()
+        if weights[PAWN]:
+            score += weights[PAWN] * (self.pawnAttacks(color) & targets & self.colorBB[1 - color]).bit_count()
+        return score
 
     # generate all possible moves, some may leave the king in check
+    # the getXMoves helpers append move codes to moves
     def getPossibleMoves(self, castle=False):
         moves = []
-        for row in range(len(self.board)):
-            for col in range(len(self.board[0])):
-                turn = self.board[row][col][0]
-                if (turn == "w" and self.whiteToMove) or (turn == "b" and not self.whiteToMove):
-                    piece = self.board[row][col][1]
-                    if castle and piece == "K":
-                        self.getKingMoves(row, col, moves, True)
-                    else:
-                        self.moveFunctions[piece](row, col, moves)
-        return moves
+        color = WHITE if self.whiteToMove else BLACK
+        for piece in range(color * 6, color * 6 + 6):
+            for sq in bb.squares(self.pieceBB[piece]):
+                if castle and piece % 6 == KING:
+                    self.getKingMoves(sq >> 3, sq & 7, moves, True)
+                else:
+                    self.moveFunctions[PIECE_NAMES[piece][1]](sq >> 3, sq & 7, moves)
+        return [Move.fromCode(code) for code in moves]
+
+    # add a move from sq to every target square not held by the mover's own pieces
+    def _addMoves(self, sq, targets, moves):
+        piece = self.squares[sq]
+        squares = self.squares
+        for target in bb.squares(targets & ~self.colorBB[piece // 6]):
+            moves.append(sq | target << 6 | piece << 12 | squares[target] << 16)
 
     def getPawnMoves(self, row, col, moves):
+        sq = row * 8 + col
         if self.whiteToMove:
-            if row - 1 >= 0 and self.board[row - 1][col] == "ES":
-                moves.append(Move((row, col), (row - 1, col), self.board))
-                if row == 6 and self.board[row - 2][col] == "ES":
-                    moves.append(Move((row, col), (row - 2, col), self.board))
-            if col - 1 >= 0:
-                if self.board[row - 1][col - 1][0] == "b":
-                    moves.append(Move((row, col), (row - 1, col - 1), self.board))
-                elif (row - 1, col - 1) == self.enPassantGrid:
-                    moves.append(Move((row, col), (row - 1, col - 1), self.board, enpassant=True))
-            if col + 1 <= 7:
-                if self.board[row - 1][col + 1][0] == "b":
-                    moves.append(Move((row, col), (row - 1, col + 1), self.board))
-                elif (row - 1, col + 1) == self.enPassantGrid:
-                    moves.append(Move((row, col), (row - 1, col + 1), self.board, enpassant=True))
+            color, step, startRow = WHITE, -8, 6
         else:
             # black pawn move down the board ( row++
-            if row + 1 <= 7 and self.board[row + 1][col] == "ES":
-                moves.append(Move((row, col), (row + 1, col), self.board))
-                if row == 1 and self.board[row + 2][col] == "ES":
-                    moves.append(Move((row, col), (row + 2, col), self.board))
-            if col - 1 >= 0:
-                if self.board[row + 1][col - 1][0] == "w":
-                    moves.append(Move((row, col), (row + 1, col - 1), self.board))
-                elif (row + 1, col - 1) == self.enPassantGrid:
-                    moves.append(Move((row, col), (row + 1, col - 1), self.board, enpassant=True))
-            if col + 1 <= 7:
-                if self.board[row + 1][col + 1][0] == "w":
-                    moves.append(Move((row, col), (row + 1, col + 1), self.board))
-                elif (row + 1, col + 1) == self.enPassantGrid:
-                    moves.append(Move((row, col), (row + 1, col + 1), self.board, enpassant=True))
+            color, step, startRow = BLACK, 8, 1
+        piece = color * 6 + PAWN
+        if 0 <= sq + step < 64 and not self.occupied >> (sq + step) & 1:
+            _addPawnMove(encodeMove(sq, sq + step, piece, EMPTY), sq + step, moves)
+            if row == startRow and not self.occupied >> (sq + 2 * step) & 1:
+                moves.append(encodeMove(sq, sq + 2 * step, piece, EMPTY))
+        attacks = bb.PAWN_ATTACKS[color][sq]
+        for target in bb.squares(attacks & self.colorBB[1 - color]):
+            _addPawnMove(encodeMove(sq, target, piece, self.squares[target]), target, moves)
+        if self.enPassantGrid:
+            target = self.enPassantGrid[0] * 8 + self.enPassantGrid[1]
+            if attacks >> target & 1:
+                moves.append(encodeMove(sq, target, piece, (1 - color) * 6 + PAWN, FLAG_EN_PASSANT))
 
     def getRookMoves(self, row, col, moves):
-        directions = ((1, 0), (-1, 0), (0, 1), (0, -1))
-        for direction in directions:
-            for i in range(1, 8):
-                row1 = row + i * direction[0]
-                col1 = col + i * direction[1]
-                if 0 <= row1 <= 7 and 0 <= col1 <= 7:
-                    if self.board[row1][col1] == "ES":
-                        moves.append(Move((row, col), (row1, col1), self.board))
-                    elif self.board[row1][col1][0] != self.getTurn():
-                        moves.append(Move((row, col), (row1, col1), self.board))
-                        break
-                    else:
-                        break
+        sq = row * 8 + col
+        self._addMoves(sq, bb.rookAttacks(sq, self.occupied), moves)
 
     def getBishopMoves(self, row, col, moves):
-        directions = ((1, 1), (-1, -1), (-1, 1), (1, -1))
-        for direction in directions:
-            for i in range(1, 8):
-                row1 = row + i * direction[0]
-                col1 = col + i * direction[1]
-                if 0 <= row1 <= 7 and 0 <= col1 <= 7:
-                    if self.board[row1][col1] == "ES":
-                        moves.append(Move((row, col), (row1, col1), self.board))
-                    elif self.board[row1][col1][0] != self.getTurn():
-                        moves.append(Move((row, col), (row1, col1), self.board))
-                        break
-                    else:
-                        break
+        sq = row * 8 + col
+        self._addMoves(sq, bb.bishopAttacks(sq, self.occupied), moves)
 
     def getKingMoves(self, row, col, moves, castle=False):
-        directions = ((1, 0), (-1, 0), (1, 1), (0, 1), (-1, 1), (1, -1), (0, -1), (-1, -1))
-        for direction in directions:
-            row1 = row + direction[0]
-            col1 = col + direction[1]
-            if 0 <= row1 <= 7 and 0 <= col1 <= 7:
-                if self.board[row1][col1] == "ES" or self.board[row1][col1][0] != self.getTurn():
-                    moves.append(Move((row, col), (row1, col1), self.board))
+        sq = row * 8 + col
+        self._addMoves(sq, bb.KING_ATTACKS[sq], moves)
         if castle:
             self.getCastleMoves(row, col, moves)
             # get all valid castle moves for the color king at (row,col) and append
@@ -295,32 +937,73 @@ class GameState:
             self.getQueenCastleMove(row, col, moves)
 
     def getKingCastleMove(self, row, col, moves):
-        if self.board[row][col + 1] != "ES" or self.board[row][col + 2] != "ES":
+        sq = row * 8 + col
+        if self.occupied & ((1 << (sq + 1)) | (1 << (sq + 2))):
             return
         if self.underAttack(row, col + 1) or self.underAttack(row, col + 2):
             return
-        moves.append(Move((row, col), (row, col + 2), self.board, castling=True))
+        moves.append(encodeMove(sq, sq + 2, self.squares[sq], EMPTY, FLAG_CASTLING))
 
     def getQueenCastleMove(self, row, col, moves):
         # queen side -- left
-        if self.board[row][col - 1] != "ES" or self.board[row][col - 2] != "ES" or self.board[row][col - 3] != "ES":
+        sq = row * 8 + col
+        if self.occupied & ((1 << (sq - 1)) | (1 << (sq - 2)) | (1 << (sq - 3))):
             return
         if self.underAttack(row, col - 1) or self.underAttack(row, col - 2):
             return
-        moves.append(Move((row, col), (row, col - 2), self.board, castling=True))
+        moves.append(encodeMove(sq, sq - 2, self.squares[sq], EMPTY, FLAG_CASTLING))
 
     def getQueenMoves(self, row, col, moves):
-        self.getRookMoves(row, col, moves)
-        self.getBishopMoves(row, col, moves)
+        sq = row * 8 + col
+        self._addMoves(sq, bb.queenAttacks(sq, self.occupied), moves)
 
     def getKnightMoves(self, row, col, moves):
-        directions = ((1, 2), (1, -2), (-1, 2), (-1, -2), (2, 1), (2, -1), (-2, 1), (-2, -1))
-        for direction in directions:
-            row1 = row + direction[0]
-            col1 = col + direction[1]
-            if 0 <= row1 <= 7 and 0 <= col1 <= 7:
-                if self.board[row1][col1] == "ES" or self.board[row1][col1][0] != self.getTurn():
-                    moves.append(Move((row, col), (row1, col1), self.board))
+        sq = row * 8 + col
+        self._addMoves(sq, bb.KNIGHT_ATTACKS[sq], moves)
+
+
+# a pawn reaching the last row becomes one move per promotion piece, queen first
+def _addPawnMove(code, target, moves):
+    if target < 8 or target >= 56:
+        for promotion in (QUEEN, KNIGHT, ROOK, BISHOP):
+            moves.append(code | FLAG_PROMOTION << 20 | promotion << 23)
+    else:
+        moves.append(code)
+
+
+# GameState.board: board[row][col] is the name of the piece there, read live from GameState.squares
+# example: wN: white kNight, bK: black King, ES: Empty Space
+# a tuple of the 8 rows, so board[row] is plain tuple indexing and only the column lookup runs Python code
+class BoardView(tuple):
+    __slots__ = ()
+
+    def __new__(cls, squares):
+        return tuple.__new__(cls, [BoardRow(squares, row * 8) for row in range(8)])
+
+    # the board as the 8x8 string array GameState.board used to be
+    def toArray(self):
+        import numpy as np
+        return np.array([PIECE_NAMES[piece] for piece in self[0].squares]).reshape((8, 8))
+
+
+# one row of a BoardView, indexes GameState.squares directly without copying anything
+class BoardRow:
+    __slots__ = ("squares", "start")
+
+    def __init__(self, squares, start):
+        self.squares = squares
+        self.start = start
+
+    def __getitem__(self, col):
+        if not 0 <= col < 8:
+            raise IndexError("board column out of range")
+        return PIECE_NAMES[self.squares[self.start + col]]
+
+    def __len__(self):
+        return 8
+
+    def __iter__(self):
+        return (PIECE_NAMES[piece] for piece in self.squares[self.start:self.start + 8])
 
 
 class CastleRights:
@@ -337,86 +1020,182 @@ class CastleRights:
         bqsStr = "True" if self.bqs else "False"
         return "wks:" + wksStr + " wqs:" + wqsStr + " bks:" + bksStr + " bqs:" + bqsStr
 
+    # 0-15, one bit per right, used to pick the zobrist key
+    def index(self):
+        return self.wks | self.wqs << 1 | self.bks << 2 | self.bqs << 3
+
+    # the FEN castling field, e.g. "KQkq", "-" without rights
+    def toFen(self):
+        text = ("K" if self.wks else "") + ("Q" if self.wqs else "") + ("k" if self.bks else "") + \
+               ("q" if self.bqs else "")
+        return text or "-"
+
     def makeCopy(self):
         copy = CastleRights(wks=self.wks, wqs=self.wqs, bks=self.bks, bqs=self.bqs)
         return copy
 
 
 class Move:
+    # a Move only wraps its move code, see encodeMove
+    __slots__ = ("code",)
+
     ranksToRows = {"1": 7, "2": 6, "3": 5, "4": 4, "5": 3, "6": 2, "7": 1, "8": 0}
     rowsToRanks = {v: k for k, v in ranksToRows.items()}
     filesToCols = {"a": 0, "b": 1, "c": 2, "d": 3, "e": 4, "f": 5, "g": 6, "h": 7}
     colsToFiles = {v: k for k, v in filesToCols.items()}
 
-    def __init__(self, start_square, end_square, board, enpassant=False, castling=False):
-        self.row0, self.col0 = start_square
-        self.row1, self.col1 = end_square
-        self.pieceToMove = board[self.row0][self.col0]
-        self.pieceToCapture = board[self.row1][self.col1]
+    def __init__(self, start_square, end_square, board, enpassant=False, castling=False, promotionChoice="Q"):
+        row0, col0 = start_square
+        row1, col1 = end_square
+        piece = PIECE_CODES[board[row0][col0]]
+        captured = PIECE_CODES[board[row1][col1]]
+        flags = 0
+        promotion = 0
+        if (piece == PAWN and row1 == 0) or (piece == BLACK * 6 + PAWN and row1 == 7):
+            flags |= FLAG_PROMOTION
+            promotion = PROMOTION_LETTERS.index(promotionChoice)
+        if enpassant:
+            flags |= FLAG_EN_PASSANT
+            captured = PAWN if piece == BLACK * 6 + PAWN else BLACK * 6 + PAWN
+        if castling:
+            flags |= FLAG_CASTLING
+        self.code = encodeMove(row0 * 8 + col0, row1 * 8 + col1, piece, captured, flags, promotion)
 
-        self.promotionChoice = "Q"
-        self.isPawnPromotion = (self.pieceToMove == "wP" and self.row1 == 0) or \
-                               (self.pieceToMove == "bP" and self.row1 == 7)
+    @classmethod
+    def fromCode(cls, code):
+        move = cls.__new__(cls)
+        move.code = code
+        return move
 
-        self.isEnPassantMove = enpassant
-        self.isCastling = castling
-        if enpassant:
-            self.pieceToCapture = "wP" if self.pieceToMove == "bP" else "bP"
+    @property
+    def row0(self):
+        return self.code >> 3 & 7
+
+    @property
+    def col0(self):
+        return self.code & 7
+
+    @property
+    def row1(self):
+        return self.code >> 9 & 7
+
+    @property
+    def col1(self):
+        return self.code >> 6 & 7
+
+    @property
+    def pieceToMove(self):
+        return PIECE_NAMES[self.code >> 12 & 15]
+
+    @property
+    def pieceToCapture(self):
+        return PIECE_NAMES[self.code >> 16 & 15]
+
+    @property
+    def isPawnPromotion(self):
+        return self.code >> 20 & FLAG_PROMOTION != 0
+
+    @property
+    def isEnPassantMove(self):
+        return self.code >> 20 & FLAG_EN_PASSANT != 0
+
+    @property
+    def isCastling(self):
+        return self.code >> 20 & FLAG_CASTLING != 0
+
+    @property
+    def promotionChoice(self):
+        return PROMOTION_LETTERS[self.code >> 23 & 7] if self.isPawnPromotion else "Q"
+
+    @promotionChoice.setter
+    def promotionChoice(self, choice):
+        if self.isPawnPromotion:
+            self.code = self.code & ~(7 << 23) | PROMOTION_LETTERS.index(choice) << 23
 
     def __hash__(self):
-        return hash((self.row0, self.col0, self.row1, self.col1))
+        return hash(self.code & MOVE_KEY_MASK)
 
     def __eq__(self, other):
         if not isinstance(other, Move):
             return False
-        return self.row0 == other.row0 and self.col0 == other.col0 and \
-               self.row1 == other.row1 and self.col1 == other.col1
+        return self.code & MOVE_KEY_MASK == other.code & MOVE_KEY_MASK
 
+    # debugging notation, e.g. "e2->e4"; see getSan and getUci for the standard ones
     def getChessNotation(self):
-        # TODO: Convert to formal chess notation
         return self.colsToFiles[self.col0] + self.rowsToRanks[self.row0] + "->" + \
                self.colsToFiles[self.col1] + self.rowsToRanks[self.row1]
 
+    # standard algebraic notation, gameState is the position the move is played from
+    def getSan(self, gameState):
+        return gameState.toSan(self.code)
+
+    # long algebraic notation of the UCI protocol, e.g. "e2e4", "e7e8q"
+    def getUci(self):
+        uci = self.colsToFiles[self.col0] + self.rowsToRanks[self.row0] + \
+              self.colsToFiles[self.col1] + self.rowsToRanks[self.row1]
+        if self.isPawnPromotion:
+            uci += PROMOTION_LETTERS[self.code >> 23 & 7].lower()
+        return uci
+
 
 materialValue = {"K": 0, "Q": 9, "P": 1, "R": 5, "B": 3, "N": 3}
 
 
+# kept up to date by makeMove/undoMove, so this is O(1)
 def materialBalance(gameState):
-    board = gameState.board
-    wSum = 0
-    bSum = 0
-    for row in board:
-        for sq in row:
-            if sq[0] == "w":
-                wSum += materialValue[sq[1]]
-            elif sq[0] == "b":
-                bSum += materialValue[sq[1]]
-    return wSum - bSum
+    return gameState.materialScore
+
+
+# material and piece-square tables, blended from middlegame to endgame by the material left
+# in centipawns for white, O(1) like materialBalance
+def taperedEval(gameState):
+    return ev.taper(gameState.mgScore, gameState.egScore, gameState.phase)
+
 
+PAWN_TABLE = ev.PawnTable()
 
-def mobility(gameState):
-    return len(gameState.getValidMoves())
+
+# doubled, isolated and passed pawns and king shelter, cached by pawnKingKey since pawns rarely move
+def pawnStructure(gameState, table=PAWN_TABLE):
+    terms = table.probe(gameState.pawnKingKey)
+    if terms is None:
+        pieceBB = gameState.pieceBB
+        terms = ev.pawnKingTerms(pieceBB[PAWN], pieceBB[BLACK * 6 + PAWN],
+                                 bb.lsb(pieceBB[KING]), bb.lsb(pieceBB[BLACK * 6 + KING]))
+        table.store(gameState.pawnKingKey, terms)
+    return ev.taper(terms[0], terms[1], gameState.phase)
+
+
+# weighted attacked squares of white minus black, see GameState.mobilityScore
+def mobility(gameState, safe=True):
+    return gameState.mobilityScore(WHITE, safe) - gameState.mobilityScore(BLACK, safe)
+
+
+# the evaluation terms together, in centipawns for white
+def evaluate(gameState):
+    return taperedEval(gameState) + pawnStructure(gameState) + mobility(gameState)
 
 
 class PawnKingStructure:
     def __init__(self, white=True):
+        import numpy as np
         self.pk = np.zeros((8, 8))
         if white:
             self.pk[6] = [1, 1, 1, 1, 1, 1, 1, 1]
             self.pk[7][4] = -1
         else:
-            self.pk = [1, 1, 1, 1, 1, 1, 1, 1]
+            self.pk[1] = [1, 1, 1, 1, 1, 1, 1, 1]
             self.pk[0][4] = -1
 
-    #def __hash__(self):
-
+    # a structure equals its mirror image, so hash the smaller of the two
+    def __hash__(self):
+        import numpy as np
+        return hash(min(self.pk.tobytes(), np.flip(self.pk, axis=0).tobytes()))
 
     def __eq__(self, other):
+        import numpy as np
         if not isinstance(other, PawnKingStructure):
             return False
-        if self.pk == other.pk:
+        if np.array_equal(self.pk, other.pk):
             return True
-        np.flip(other.pk, axis=0)
-        if self.pk == other.pk:
-            return True
-        return False
+        return np.array_equal(self.pk, np.flip(other.pk, axis=0))
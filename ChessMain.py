@@ -1,3 +1,5 @@
+import concurrent.futures
+
 import pygame
 
 from shallowBlue import ChessEngine
@@ -8,7 +10,8 @@ DIMENSION = 8
 SQ_SIZE = HEIGHT // DIMENSION  # // for ints rather than float
 MAX_FPS = 15
 IMAGES = {}  # a python dictionary for images, indexing by IMAGES['bP']
-Agent = Agents.GreedyAgent(ChessEngine.materialBalance)
+THINKING = {}  # the last search iteration reported by Agent, shown while it thinks
+Agent = Agents.ABAgent(ChessEngine.evaluate, depth=4, timeLimit=3.0, reporter=THINKING.update)
 RAgent = Agents.RandomAgent()
 """
 initialize a global dictionary of images
@@ -34,8 +37,12 @@ def main():
     gameOver = False
     playerWhite = True  # if real person - True, if AI false
     playerBlack = True
+    # the AI searches a copy of the state in a worker thread, so the window keeps running meanwhile
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+    aiFuture = None
 
     load_images()
+    renderer = BoardRenderer(screen)
     running = True
     sq_selected = ()
     clicks = []
@@ -44,6 +51,9 @@ def main():
         for e in pygame.event.get():
             if e.type == pygame.QUIT:
                 running = False
+            # the window was uncovered, its content may be gone
+            elif e.type == pygame.VIDEOEXPOSE:
+                renderer.invalidate()
             # mouse events
             elif e.type == pygame.MOUSEBUTTONDOWN:
                 if not gameOver:
@@ -66,14 +76,16 @@ def main():
                                 if move == valid_moves[i]:
                                     state.makeMove(valid_moves[i])
                                     move_made = True
-                                    if state.checkmate or state.stalemate:
-                                        gameOver = True
                                     sq_selected = ()
                                     clicks = []
                             if not move_made:
                                 clicks = [sq_selected]
             # key events
             elif e.type == pygame.KEYDOWN:
+                # the position changes under a running search, its move is of no use any more
+                if e.key in (pygame.K_z, pygame.K_r):
+                    cancelSearch(aiFuture)
+                    aiFuture = None
                 if e.key == pygame.K_z:  # if z is pressed
                     state.undoMove()
                     move_made = True
@@ -82,87 +94,180 @@ def main():
                     state = ChessEngine.GameState()
                     sq_selected = ()
                     clicks = []
-                    move_made = False
+                    move_made = True
 
-        # ai move finder (no events needed
+        # ai move finder (no events needed): start a search, play its move once it is done
+        humanTurn = (state.whiteToMove and playerWhite) or (not state.whiteToMove and playerBlack)
         if not gameOver and not humanTurn:
-            valid_moves = state.getValidMoves()
-            if state.checkmate or state.stalemate:
-                state.gameOver = True
-                return
-            moveAI = Agent.getAction(state)
-            if moveAI is None:
-                moveAI = RAgent.getAction(state)
-            state.makeMove(moveAI)
-            move_made = True
+            if aiFuture is None:
+                THINKING.clear()
+                aiFuture = executor.submit(runSearch, state.copy())
+            elif aiFuture.done():
+                moveAI = aiFuture.result()
+                aiFuture = None
+                if moveAI is None:
+                    moveAI = RAgent.getAction(state)
+                state.makeMove(moveAI)
+                move_made = True
 
         if move_made:
             valid_moves = state.getValidMoves()
             move_made = False
+            gameOver = state.checkmate or state.stalemate or state.drawReason() is not None
 
-        draw(screen, state, valid_moves, sq_selected)
-
-        # TODO check gameOVer
+        texts = []
+        if aiFuture is not None:
+            texts.append((thinkingText(), STATUS_TEXT))
         if gameOver:
-            if state.checkmate:
-                if state.whiteToMove:
-                    drawText(screen, "black wins - checkmate")
-                else:
-                    drawText(screen, "white wins - checkmate")
-            elif state.stalemate:
-                drawText(screen, "stalemate")
+            texts.append((gameOverText(state), RESULT_TEXT))
+        # only the squares and texts that changed since the last frame are drawn and sent to the display
+        dirty = renderer.render(state, valid_moves, sq_selected, texts)
+        if dirty:
+            pygame.display.update(dirty)
 
         clock.tick(MAX_FPS)
-        pygame.display.flip()
-
 
-def draw_squares(screen):
-    colors = [pygame.Color("white"), pygame.Color("lightblue")]
-    for row in range(DIMENSION):
-        for col in range(DIMENSION):
-            pygame.draw.rect(screen, colors[(row + col) % 2],
-                             pygame.Rect(col * SQ_SIZE, row * SQ_SIZE, SQ_SIZE, SQ_SIZE))
+    cancelSearch(aiFuture)
+    executor.shutdown(wait=False)
 
 
-def draw_pieces(screen, game_state):
-    for row in range(DIMENSION):
-        for col in range(DIMENSION):
-            piece = game_state.board[row][col]
-            if piece != "ES":
-                screen.blit(IMAGES[piece], pygame.Rect(col * SQ_SIZE, row * SQ_SIZE, SQ_SIZE, SQ_SIZE))
+# runs in the worker thread, once any cancelled search before it has returned
+# a stop that reached the agent after its last search had already finished must not cut this one short
+def runSearch(gameState):
+    if hasattr(Agent, "stopRequested"):
+        Agent.stopRequested = False
+    return Agent.getAction(gameState)
 
 
-def highlight(screen, gameState, validMoves, sqSelected):
-    if sqSelected == ():
+# ask a running search to give up; it finishes in the background and its move is dropped
+def cancelSearch(future):
+    if future is None:
         return
-    row, col = sqSelected
-    if (gameState.whiteToMove and gameState.board[row][col][0] == "w") or (
-            not gameState.whiteToMove and gameState.board[row][col][0] == "b"):
-        # highlight sq
-        surface = pygame.Surface((SQ_SIZE, SQ_SIZE))
-        surface.set_alpha(100)  # 0->transparent, 255->opaque
-        surface.fill(pygame.Color("gold"))
-        screen.blit(surface, (col * SQ_SIZE, row * SQ_SIZE))
-        # highlight moves
-        surface.fill(pygame.Color("aquamarine"))
-        for move in validMoves:
-            if move.row0 == row and move.col0 == col:
-                screen.blit(surface, (move.col1 * SQ_SIZE, move.row1 * SQ_SIZE))
-
-
-def draw(screen, game_state, validMoves, sqSelected):
-    draw_squares(screen)
-    highlight(screen, game_state, validMoves, sqSelected)
-    draw_pieces(screen, game_state)  # draw pieces on top of squares
-
-
-def drawText(screen, text):
-    print(text)
-    font = pygame.font.SysFont("Helvtica", 30, True, False)
-    textAdded = font.render(text, 0, pygame.Color("Black"))
-    textLocation = pygame.Rect(0, 0, WIDTH, HEIGHT).move(
-        WIDTH / 2 - textAdded.get_width() / 2, HEIGHT / 2 - textAdded.get_height() / 2)
-    screen.blit(textAdded, textLocation)
+    if not future.cancel() and not future.done() and hasattr(Agent, "stop"):
+        Agent.stop()
+
+
+def thinkingText():
+    if not THINKING:
+        return "thinking..."
+    return "thinking... depth %d  score %+.2f  %d nodes  %s" % (
+        THINKING["depth"], THINKING["score"] / 100, THINKING["nodes"],
+        " ".join(move.getChessNotation() for move in THINKING["pv"][:3]))
+
+
+def gameOverText(state):
+    if state.checkmate:
+        return "black wins - checkmate" if state.whiteToMove else "white wins - checkmate"
+    if state.stalemate:
+        return "stalemate"
+    return "draw - " + str(state.drawReason())
+
+
+# text styles: (font size, bold, where on the board)
+STATUS_TEXT = (20, False, "bottom")
+RESULT_TEXT = (30, True, "center")
+FONTS = {}  # SysFont is slow, one font per (size, bold)
+
+
+def get_font(size, bold):
+    if (size, bold) not in FONTS:
+        FONTS[size, bold] = pygame.font.SysFont("Helvtica", size, bold, False)
+    return FONTS[size, bold]
+
+
+# draws the board into screen, repainting only what changed since the previous frame
+class BoardRenderer:
+    def __init__(self, screen):
+        self.screen = screen
+        # the empty board, drawn once; squares are repainted by copying from it
+        self.background = pygame.Surface((WIDTH, HEIGHT))
+        colors = [pygame.Color("white"), pygame.Color("lightblue")]
+        for row in range(DIMENSION):
+            for col in range(DIMENSION):
+                pygame.draw.rect(self.background, colors[(row + col) % 2],
+                                 pygame.Rect(col * SQ_SIZE, row * SQ_SIZE, SQ_SIZE, SQ_SIZE))
+        # highlights: the selected piece and the squares it can move to
+        self.highlights = {}
+        for kind, color in (("selected", "gold"), ("target", "aquamarine")):
+            surface = pygame.Surface((SQ_SIZE, SQ_SIZE))
+            surface.set_alpha(100)  # 0->transparent, 255->opaque
+            surface.fill(pygame.Color(color))
+            self.highlights[kind] = surface
+        self.textSurfaces = {}
+        self.invalidate()
+
+    # forget what is on the screen, the next render repaints everything
+    def invalidate(self):
+        self.shown = [None] * 64  # (piece code, highlight) last drawn on every square
+        self.shownTexts = []  # (text, style, rect) last drawn
+
+    def squareHighlights(self, gameState, validMoves, sqSelected):
+        highlights = {}
+        if sqSelected == ():
+            return highlights
+        row, col = sqSelected
+        piece = gameState.squares[row * 8 + col]
+        if piece != ChessEngine.EMPTY and (piece // 6 == ChessEngine.WHITE) == gameState.whiteToMove:
+            highlights[row * 8 + col] = "selected"
+            for move in validMoves:
+                if move.row0 == row and move.col0 == col:
+                    highlights[move.row1 * 8 + move.col1] = "target"
+        return highlights
+
+    def textSurface(self, text, style):
+        surface = self.textSurfaces.get((text, style))
+        if surface is None:
+            if len(self.textSurfaces) > 64:
+                self.textSurfaces.clear()
+            size, bold, where = style
+            if where == "bottom":
+                surface = get_font(size, bold).render(text, True, pygame.Color("Black"), pygame.Color("white"))
+            else:
+                surface = get_font(size, bold).render(text, True, pygame.Color("Black"))
+                print(text)
+            self.textSurfaces[text, style] = surface
+        return surface
+
+    def textRect(self, surface, style):
+        if style[2] == "bottom":
+            return surface.get_rect(bottomleft=(4, HEIGHT - 4))
+        return surface.get_rect(center=(WIDTH // 2, HEIGHT // 2))
+
+    # draw what changed, texts are (text, style) pairs drawn over the board; returns the rects to update
+    def render(self, gameState, validMoves, sqSelected, texts):
+        texts = [(text, style, self.textRect(self.textSurface(text, style), style)) for text, style in texts]
+        highlights = self.squareHighlights(gameState, validMoves, sqSelected)
+        looks = [(gameState.squares[sq], highlights.get(sq)) for sq in range(64)]
+        changed = {sq for sq in range(64) if looks[sq] != self.shown[sq]}
+        # a text is drawn over fresh squares: when it changes, or a square under it changes, all of them are repainted
+        covered = [set(self.squaresUnder(rect)) for text, style, rect in self.shownTexts + texts]
+        redrawTexts = texts != self.shownTexts or any(under & changed for under in covered)
+        if redrawTexts:
+            for under in covered:
+                changed |= under
+        dirty = []
+        for sq in sorted(changed):
+            look = looks[sq]
+            self.shown[sq] = look
+            rect = pygame.Rect((sq & 7) * SQ_SIZE, (sq >> 3) * SQ_SIZE, SQ_SIZE, SQ_SIZE)
+            self.screen.blit(self.background, rect, rect)
+            if look[1] is not None:
+                self.screen.blit(self.highlights[look[1]], rect)
+            if look[0] != ChessEngine.EMPTY:
+                self.screen.blit(IMAGES[ChessEngine.PIECE_NAMES[look[0]]], rect)
+            dirty.append(rect)
+        if redrawTexts:
+            for text, style, rect in texts:
+                self.screen.blit(self.textSurface(text, style), rect)
+                dirty.append(rect)
+        self.shownTexts = texts
+        return dirty
+
+    def squaresUnder(self, rect):
+        rect = rect.clip(pygame.Rect(0, 0, WIDTH, HEIGHT))
+        for row in range(rect.top // SQ_SIZE, (rect.bottom - 1) // SQ_SIZE + 1):
+            for col in range(rect.left // SQ_SIZE, (rect.right - 1) // SQ_SIZE + 1):
+                yield row * 8 + col
 
 
 if __name__ == "__main__":
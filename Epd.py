@@ -0,0 +1,87 @@
+"""
+EPD and FEN position files.
+An EPD line is the first four FEN fields followed by operations, each an opcode and operands ended by ";":
+    rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq e3 bm e5; id "start 1";
+The hmvc and fmvn operations set the move counters. Plain six-field FEN lines are read as well.
+Files are read line by line, so they can be much larger than memory.
+"""
+
+import shlex
+
+from shallowBlue import ChessEngine
+
+
+# the operations of an EPD line as {opcode: [operands]}, quoted operands keep their spaces
+def parseOperations(text):
+    operations = {}
+    for operation in _splitOperations(text):
+        lexer = shlex.shlex(operation, posix=True)
+        lexer.quotes = '"'  # an apostrophe is just a character
+        lexer.whitespace_split = True
+        lexer.commenters = ""
+        tokens = list(lexer)
+        if tokens:
+            operations[tokens[0]] = tokens[1:]
+    return operations
+
+
+def _splitOperations(text):
+    # split on the semicolons that are not inside quotes
+    operation = ""
+    quoted = False
+    for char in text:
+        if char == '"':
+            quoted = not quoted
+        if char == ";" and not quoted:
+            yield operation.strip()
+            operation = ""
+        else:
+            operation += char
+    if operation.strip():
+        yield operation.strip()
+
+
+# (fen, operations) of an EPD or FEN line, None for blank lines and # comments
+def parseLine(line):
+    line = line.strip()
+    if not line or line.startswith("#"):
+        return None
+    fields = line.split(None, 4)
+    if len(fields) < 4:
+        raise ValueError("EPD line needs at least 4 fields: " + line)
+    rest = fields[4] if len(fields) > 4 else ""
+    counters = rest.split(None, 2)
+    if len(counters) >= 2 and counters[0].isdigit() and counters[1].isdigit():
+        # a FEN line, anything after the counters is still read as operations
+        return " ".join(fields[:4] + counters[:2]), parseOperations(counters[2] if len(counters) > 2 else "")
+    operations = parseOperations(rest)
+    halfmove = operations.get("hmvc", ["0"])[0]
+    fullmove = operations.get("fmvn", ["1"])[0]
+    return " ".join(fields[:4] + [halfmove, fullmove]), operations
+
+
+# yield (fen, operations) for every position of the file, one line at a time
+def readFens(path):
+    with open(path, encoding="utf-8", errors="replace") as f:
+        for lineNumber, line in enumerate(f, 1):
+            try:
+                parsed = parseLine(line)
+            except ValueError as e:
+                raise ValueError("%s:%d: %s" % (path, lineNumber, e))
+            if parsed is not None:
+                yield parsed
+
+
+# yield (GameState, operations) for every position of the file
+def readEpd(path):
+    for fen, operations in readFens(path):
+        yield ChessEngine.GameState(fen), operations
+
+
+# the EPD line of a position, operations is {opcode: [operands]} like parseOperations returns
+def toEpd(gameState, operations=None):
+    text = " ".join(gameState.toFen().split()[:4])
+    for opcode, operands in (operations or {}).items():
+        quoted = ['"%s"' % operand if " " in operand or ";" in operand else operand for operand in operands]
+        text += " " + " ".join([opcode] + quoted) + ";"
+    return text
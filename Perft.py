@@ -0,0 +1,216 @@
+"""
+Count the leaf nodes of the move tree (perft) to check and time the move generator.
+Run as a script:
+    python -m shallowBlue.Perft                      run the test suite up to depth 3
+    python -m shallowBlue.Perft --depth 5 --fen FEN  time one position
+    python -m shallowBlue.Perft --divide --fen FEN   node count per root move
+    python -m shallowBlue.Perft --epd FILE           run the positions of an EPD file, with their counts
+                                                     given as D1 20; D2 400; ... operations
+    python -m shallowBlue.Perft --check              compare getValidMoves against the make/undo
+                                                     filtering generator and getCaptureCodes,
+                                                     and the incremental zobrist keys and
+                                                     evaluation scores against a full
+                                                     recomputation
+"""
+
+import argparse
+import random
+import sys
+import time
+
+from shallowBlue import ChessEngine
+from shallowBlue import Epd
+
+# (name, FEN, {depth: leaf nodes}), counts from the chessprogramming wiki and the usual edge case lists
+PERFT_SUITE = [
+    ("start", ChessEngine.START_FEN,
+     {1: 20, 2: 400, 3: 8902, 4: 197281, 5: 4865609}),
+    ("kiwipete", "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+     {1: 48, 2: 2039, 3: 97862, 4: 4085603}),
+    ("position 3", "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+     {1: 14, 2: 191, 3: 2812, 4: 43238, 5: 674624}),
+    ("position 4", "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+     {1: 6, 2: 264, 3: 9467, 4: 422333}),
+    ("position 5", "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8",
+     {1: 44, 2: 1486, 3: 62379, 4: 2103487}),
+    ("position 6", "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+     {1: 46, 2: 2079, 3: 89890, 4: 3894594}),
+    ("illegal en passant 1", "3k4/3p4/8/K1P4r/8/8/8/8 b - - 0 1",
+     {1: 18, 2: 92, 3: 1670, 4: 10138, 6: 1134888}),
+    ("illegal en passant 2", "8/8/4k3/8/2p5/8/B2P2K1/8 w - - 0 1",
+     {1: 13, 2: 102, 3: 1266, 4: 10276, 6: 1015133}),
+    ("en passant gives check", "8/8/1k6/2b5/2pP4/8/5K2/8 b - d3 0 1",
+     {1: 15, 2: 126, 3: 1928, 4: 13931, 6: 1440467}),
+    ("short castle gives check", "5k2/8/8/8/8/8/8/4K2R w K - 0 1",
+     {1: 15, 2: 66, 3: 1198, 4: 6399, 6: 661072}),
+    ("long castle gives check", "3k4/8/8/8/8/8/8/R3K3 w Q - 0 1",
+     {1: 16, 2: 71, 3: 1286, 4: 7418, 6: 803711}),
+    ("castle rights", "r3k2r/1b4bq/8/8/8/8/7B/R3K2R w KQkq - 0 1",
+     {1: 26, 2: 1141, 3: 27826, 4: 1274206}),
+    ("castling prevented", "r3k2r/8/3Q4/8/8/5q2/8/R3K2R b KQkq - 0 1",
+     {1: 44, 2: 1494, 3: 50509, 4: 1720476}),
+    ("promote out of check", "2K2r2/4P3/8/8/8/8/8/3k4 w - - 0 1",
+     {1: 11, 2: 133, 3: 1442, 4: 19174, 6: 3821001}),
+    ("discovered check", "8/8/1P2K3/8/2n5/1q6/8/5k2 b - - 0 1",
+     {1: 29, 2: 165, 3: 5160, 4: 31961, 5: 1004658}),
+    ("promote to give check", "4k3/1P6/8/8/8/8/K7/8 w - - 0 1",
+     {1: 9, 2: 40, 3: 472, 4: 2661, 6: 217342}),
+    ("underpromote to give check", "8/P1k5/K7/8/8/8/8/8 w - - 0 1",
+     {1: 6, 2: 27, 3: 273, 4: 1329, 6: 92683}),
+    ("self stalemate", "K1k5/8/P7/8/8/8/8/8 w - - 0 1",
+     {1: 2, 2: 6, 3: 13, 4: 63, 6: 2217}),
+    ("stalemate and checkmate 1", "8/k1P5/8/1K6/8/8/8/8 w - - 0 1",
+     {1: 10, 2: 25, 3: 268, 4: 926, 7: 567584}),
+    ("stalemate and checkmate 2", "8/8/2k5/5q2/5n2/8/5K2/8 b - - 0 1",
+     {1: 37, 2: 183, 3: 6559, 4: 23527}),
+]
+
+
+def perft(gameState, depth):
+    if depth == 0:
+        return 1
+    moves = gameState.getValidMoveCodes()
+    if depth == 1:
+        return len(moves)
+    nodes = 0
+    for move in moves:
+        gameState.makeMove(move)
+        nodes += perft(gameState, depth - 1)
+        gameState.undoMove()
+    return nodes
+
+
+# perft split by root move, to find which move a wrong count comes from
+def divide(gameState, depth):
+    counts = []
+    for move in gameState.getValidMoveCodes():
+        gameState.makeMove(move)
+        counts.append((ChessEngine.Move.fromCode(move), perft(gameState, depth - 1)))
+        gameState.undoMove()
+    return counts
+
+
+# returns (nodes, seconds, nodes per second) of the move generator, without the legal move cache
+def benchmark(fen, depth):
+    gameState = ChessEngine.GameState(fen, moveCacheSize=0)
+    start = time.perf_counter()
+    nodes = perft(gameState, depth)
+    elapsed = time.perf_counter() - start
+    return nodes, elapsed, int(nodes / elapsed) if elapsed > 0 else 0
+
+
+# suite entries like PERFT_SUITE from an EPD file, read lazily; the id operation names the position
+def readSuite(path):
+    for fen, operations in Epd.readFens(path):
+        counts = {int(opcode[1:]): int(operands[0]) for opcode, operands in operations.items()
+                  if opcode[0] == "D" and opcode[1:].isdigit() and operands}
+        yield operations.get("id", [fen])[0], fen, counts
+
+
+# every suite position at every listed depth up to maxDepth, returns the names that failed
+def runSuite(maxDepth=3, out=sys.stdout, suite=PERFT_SUITE):
+    failed = []
+    totalNodes = 0
+    totalTime = 0.0
+    for name, fen, counts in suite:
+        for depth in sorted(counts):
+            if depth > maxDepth:
+                break
+            nodes, elapsed, nps = benchmark(fen, depth)
+            totalNodes += nodes
+            totalTime += elapsed
+            ok = nodes == counts[depth]
+            if not ok:
+                failed.append(name)
+            print("%-28s depth %d  %9d nodes  %-4s %7.2fs %8d nps" %
+                  (name, depth, nodes, "ok" if ok else "FAIL", elapsed, nps), file=out)
+    print("total %d nodes in %.2fs, %d nps" %
+          (totalNodes, totalTime, totalNodes / totalTime if totalTime > 0 else 0), file=out)
+    return failed
+
+
+# walk the tree with both generators and return the first position where they disagree, None if they never do
+# the capture generator must give exactly the captures and promotions among the legal moves
+def compareGenerators(gameState, depth):
+    moves = gameState.getValidMoves()
+    captures = sorted(move.code for move in moves if ChessEngine.isCaptureOrPromotion(move.code))
+    reference = gameState.getValidMovesByFiltering()
+    if set(moves) != set(reference) or len(moves) != len(reference) or \
+            sorted(gameState.getCaptureCodes()) != captures:
+        return [ChessEngine.Move.fromCode(code).getChessNotation() for code in gameState.moveLog]
+    if depth <= 1:
+        return None
+    for move in moves:
+        gameState.makeMove(move)
+        mismatch = compareGenerators(gameState, depth - 1)
+        gameState.undoMove()
+        if mismatch is not None:
+            return mismatch
+    return None
+
+
+def _incrementalMatches(gameState):
+    scores = (gameState.materialScore, gameState.mgScore, gameState.egScore, gameState.phase)
+    return gameState.zobristKey == gameState.computeZobristKey() and scores == gameState.computeScores() and \
+        gameState.pawnKingKey == gameState.computePawnKingKey()
+
+
+# play random games, checking the incremental key and scores after every makeMove and undoMove
+# returns the moves leading to the first wrong value, None if everything matched
+def checkIncremental(games=20, plies=80, seed=0):
+    rng = random.Random(seed)
+    for game in range(games):
+        gameState = ChessEngine.GameState()
+        for ply in range(plies):
+            moves = gameState.getValidMoves()
+            if not moves:
+                break
+            for move in moves:
+                gameState.makeMove(move)
+                if not _incrementalMatches(gameState):
+                    return [ChessEngine.Move.fromCode(code).getChessNotation() for code in gameState.moveLog]
+                gameState.undoMove()
+                if not _incrementalMatches(gameState):
+                    return [ChessEngine.Move.fromCode(code).getChessNotation() for code in gameState.moveLog] + \
+                           ["undo"]
+            gameState.makeMove(rng.choice(moves))
+    return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="perft test suite and move generator benchmark")
+    parser.add_argument("--depth", type=int, default=3)
+    parser.add_argument("--fen", help="only this position")
+    parser.add_argument("--epd", help="run the positions of this EPD file instead of the built-in suite")
+    parser.add_argument("--divide", action="store_true", help="node count per root move")
+    parser.add_argument("--check", action="store_true", help="compare generators, zobrist keys and scores")
+    args = parser.parse_args(argv)
+
+    if args.check:
+        for name, fen, counts in PERFT_SUITE:
+            mismatch = compareGenerators(ChessEngine.GameState(fen, moveCacheSize=0), min(args.depth, 2))
+            if mismatch is not None:
+                print(name, "- generators disagree after", " ".join(mismatch))
+                return 1
+        mismatch = checkIncremental()
+        if mismatch is not None:
+            print("zobrist key or scores wrong after", " ".join(mismatch))
+            return 1
+        print("generators, zobrist keys and scores agree")
+        return 0
+    if args.divide:
+        counts = divide(ChessEngine.GameState(args.fen or ChessEngine.START_FEN, moveCacheSize=0), args.depth)
+        for move, nodes in counts:
+            print(move.getChessNotation(), nodes)
+        print("total", sum(nodes for move, nodes in counts))
+        return 0
+    if args.fen:
+        nodes, elapsed, nps = benchmark(args.fen, args.depth)
+        print("perft(%d) = %d in %.2fs, %d nps" % (args.depth, nodes, elapsed, nps))
+        return 0
+    suite = readSuite(args.epd) if args.epd else PERFT_SUITE
+    return 1 if runSuite(args.depth, suite=suite) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
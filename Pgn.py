@@ -0,0 +1,163 @@
+"""
+PGN games: a streaming reader, SAN decoding over GameState, and a writer.
+readGames reads a file one line at a time and yields PgnGame objects with the raw SAN moves;
+readDecodedGames also turns the moves into move codes, optionally sharded over a process pool.
+"""
+
+import concurrent.futures
+import re
+import textwrap
+
+from shallowBlue import ChessEngine
+
+RESULTS = ("1-0", "0-1", "1/2-1/2", "*")
+_HEADER = re.compile(r'\[\s*(\w+)\s+"((?:[^"\\]|\\.)*)"\s*\]')
+# comments, variation brackets, NAGs, move numbers and everything else up to a separator
+_TOKEN = re.compile(r"\{[^}]*\}?|;[^\n]*|[()]|\$\d+|\d+\.+|[^\s{};()$]+")
+_MOVE_NUMBER = re.compile(r"\d+\.+")
+
+
+class PgnGame:
+    def __init__(self, headers, sans, result):
+        self.headers = headers  # tag pairs in file order, e.g. {"White": "...", "Result": "1-0"}
+        self.sans = sans  # main line only, without comments, variations or move numbers
+        self.result = result
+        # set by decode: the codes of the legal moves from the start, and why decoding stopped early
+        self.codes = None
+        self.error = None
+
+    # the position the game starts from, the FEN tag if there is one
+    def startFen(self):
+        return self.headers.get("FEN", ChessEngine.START_FEN)
+
+    # fill codes by replaying the moves; a bad move stops decoding and is described in error
+    def decode(self):
+        gameState = ChessEngine.GameState(self.startFen())
+        self.error = None
+        for ply, san in enumerate(self.sans):
+            try:
+                gameState.makeMove(gameState.parseSan(san))
+            except ValueError as e:
+                self.error = "ply %d: %s" % (ply + 1, e)
+                break
+        self.codes = gameState.moveLog
+        return self
+
+    # the position after the decoded moves
+    def gameState(self):
+        if self.codes is None:
+            self.decode()
+        gameState = ChessEngine.GameState(self.startFen())
+        for code in self.codes:
+            gameState.makeMove(code)
+        return gameState
+
+
+# (sans, result) of a movetext
+def parseMovetext(text):
+    sans = []
+    result = "*"
+    depth = 0  # inside this many variations
+    for token in _TOKEN.findall(text):
+        first = token[0]
+        if first == "{" or first == ";" or first == "$":
+            continue
+        if first == "(":
+            depth += 1
+        elif first == ")":
+            depth -= 1
+        elif depth:
+            continue
+        elif token in RESULTS:
+            result = token
+        elif first.isdigit() and _MOVE_NUMBER.fullmatch(token):
+            continue
+        else:
+            # "1.e4" is a move number stuck to its move
+            sans.append(_MOVE_NUMBER.sub("", token, 1) if first.isdigit() else token)
+    return sans, result
+
+
+# yield the games of a PGN file one at a time
+# a game ends at a result after its moves, or where the tags of the next game start
+def readGames(path):
+    with open(path, encoding="utf-8", errors="replace") as f:
+        headers = {}
+        movetext = []
+        openComments = 0
+        for line in f:
+            if not openComments and line.startswith("["):
+                if movetext:
+                    yield _makeGame(headers, movetext)
+                    headers, movetext = {}, []
+                match = _HEADER.match(line)
+                if match:
+                    headers[match.group(1)] = match.group(2).replace('\\"', '"').replace("\\\\", "\\")
+                continue
+            if line.startswith("%") or not movetext and not line.strip():
+                continue  # escaped line, or blank line before the moves
+            movetext.append(line)
+            openComments += line.count("{") - line.count("}")
+            tokens = line.split()
+            if not openComments and tokens and tokens[-1] in RESULTS:
+                yield _makeGame(headers, movetext)
+                headers, movetext = {}, []
+        if headers or movetext:
+            yield _makeGame(headers, movetext)
+
+
+def _makeGame(headers, movetext):
+    sans, result = parseMovetext(" ".join(movetext))
+    if result == "*" and headers.get("Result") in RESULTS:
+        result = headers["Result"]
+    return PgnGame(headers, sans, result)
+
+
+def _decodeChunk(games):
+    return [game.decode() for game in games]
+
+
+# yield the games of a PGN file with their moves decoded, see PgnGame.decode
+# with workers, chunks of chunkSize games are decoded in that many processes; games keep their file order
+# and only a few chunks per worker are read ahead, so memory stays bounded on any file size
+def readDecodedGames(path, workers=None, chunkSize=64):
+    if not workers or workers <= 1:
+        for game in readGames(path):
+            yield game.decode()
+        return
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = []
+        chunk = []
+        for game in readGames(path):
+            chunk.append(game)
+            if len(chunk) == chunkSize:
+                pending.append(executor.submit(_decodeChunk, chunk))
+                chunk = []
+                if len(pending) >= 2 * workers:
+                    yield from pending.pop(0).result()
+        if chunk:
+            pending.append(executor.submit(_decodeChunk, chunk))
+        for future in pending:
+            yield from future.result()
+
+
+# the PGN text of the game played so far in gameState, with the seven tag roster first
+def gameToPgn(gameState, headers=None, result="*"):
+    tags = {"Event": "?", "Site": "?", "Date": "????.??.??", "Round": "?", "White": "?", "Black": "?"}
+    tags.update(headers or {})
+    tags["Result"] = result
+    if gameState.startFen != ChessEngine.START_FEN:
+        tags["SetUp"] = "1"
+        tags["FEN"] = gameState.startFen
+    replay = ChessEngine.GameState(gameState.startFen)
+    words = []
+    for code in gameState.moveLog:
+        if replay.whiteToMove:
+            words.append("%d." % replay.fullmoveNumber)
+        elif not words:
+            words.append("%d..." % replay.fullmoveNumber)
+        words.append(replay.toSan(code))
+        replay.makeMove(code)
+    words.append(result)
+    lines = ['[%s "%s"]' % (key, str(value).replace("\\", "\\\\").replace('"', '\\"')) for key, value in tags.items()]
+    return "\n".join(lines) + "\n\n" + "\n".join(textwrap.wrap(" ".join(words), 79)) + "\n"
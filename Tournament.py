@@ -0,0 +1,205 @@
+"""
+Headless matches between two agents, played over a process pool.
+Run as a script:
+    python -m shallowBlue.Tournament ab:3 greedy --games 200 --move-time 0.5
+Agents are given as name[:depth], see AGENTS. Every opening (a few random plies from the start position)
+is played twice with colours swapped. The report gives W/D/L of the first agent, the Elo difference
+with a 95% error bar, an SPRT verdict, and the NPS and move latency percentiles of each agent.
+"""
+
+import argparse
+import concurrent.futures
+import math
+import os
+import random
+import sys
+import time
+
+from shallowBlue import Agents
+from shallowBlue import ChessEngine
+
+# agent factories by name, called as factory(depth, moveTime) inside the worker process
+AGENTS = {
+    "random": lambda depth, moveTime: Agents.RandomAgent(),
+    "greedy": lambda depth, moveTime: Agents.GreedyAgent(ChessEngine.materialBalance),
+    "greedy-eval": lambda depth, moveTime: Agents.GreedyAgent(ChessEngine.evaluate),
+    "ab": lambda depth, moveTime: Agents.ABAgent(ChessEngine.evaluate, depth=depth or 3, timeLimit=moveTime),
+    "ab-material": lambda depth, moveTime: Agents.ABAgent(ChessEngine.materialBalance, depth=depth or 3,
+                                                          timeLimit=moveTime),
+}
+MAX_PLIES = 300  # a game still running after this many plies is scored a draw
+
+
+def makeAgent(spec, moveTime=None):
+    name, _, depth = spec.partition(":")
+    if name not in AGENTS:
+        raise ValueError("unknown agent %r, pick one of %s" % (name, ", ".join(AGENTS)))
+    return AGENTS[name](int(depth) if depth else None, moveTime)
+
+
+# the same seed always gives the same opening moves
+def randomOpening(plies, seed):
+    rng = random.Random(seed)
+    gameState = ChessEngine.GameState()
+    for _ in range(plies):
+        moves = gameState.getValidMoveCodes()
+        if not moves:
+            break
+        gameState.makeMove(rng.choice(moves))
+    return gameState.moveLog
+
+
+# play one game, task is (whiteSpec, blackSpec, opening move codes, moveTime, maxPlies, seed)
+# returns a dict: result (1, 0.5 or 0 for white), reason, plies, and per colour the move latencies and nodes
+def playGame(task):
+    whiteSpec, blackSpec, opening, moveTime, maxPlies, seed = task
+    random.seed(seed)  # RandomAgent and GreedyAgent draw from the random module
+    agents = [makeAgent(whiteSpec, moveTime), makeAgent(blackSpec, moveTime)]
+    gameState = ChessEngine.GameState()
+    for code in opening:
+        gameState.makeMove(code)
+    latencies = ([], [])
+    nodes = [0, 0]
+    result, reason = 0.5, "move limit"
+    while len(gameState.moveLog) < maxPlies:
+        moves = gameState.getValidMoveCodes()
+        if not moves:
+            if gameState.checkmate:
+                result, reason = (0 if gameState.whiteToMove else 1), "checkmate"
+            else:
+                reason = "stalemate"
+            break
+        if gameState.drawReason() is not None:
+            reason = gameState.drawReason()
+            break
+        side = 0 if gameState.whiteToMove else 1
+        start = time.perf_counter()
+        move = agents[side].getAction(gameState)
+        latencies[side].append(time.perf_counter() - start)
+        nodes[side] += getattr(agents[side], "nodes", 0)
+        if move is None or move.code not in moves:
+            result, reason = (0 if side == 0 else 1), "illegal move"
+            break
+        gameState.makeMove(move)
+    return {"result": result, "reason": reason, "plies": len(gameState.moveLog),
+            "latencies": latencies, "nodes": nodes}
+
+
+def expectedScore(elo):
+    return 1 / (1 + 10 ** (-elo / 400))
+
+
+def eloFromScore(score):
+    score = min(max(score, 1e-6), 1 - 1e-6)
+    return -400 * math.log10(1 / score - 1)
+
+
+# (elo, lower, upper) of the 95% confidence interval, from the per-game scores (1, 0.5, 0)
+def eloInterval(scores):
+    n = len(scores)
+    mean = sum(scores) / n
+    deviation = math.sqrt(sum((s - mean) ** 2 for s in scores) / n / n)
+    return eloFromScore(mean), eloFromScore(mean - 1.96 * deviation), eloFromScore(mean + 1.96 * deviation)
+
+
+# log likelihood ratio of H1 (elo1) against H0 (elo0), normal approximation of the trinomial model
+# returns (llr, lower bound, upper bound); the test accepts H1 above the upper bound and H0 below the lower one
+def sprt(scores, elo0=0.0, elo1=5.0, alpha=0.05, beta=0.05):
+    n = len(scores)
+    mean = sum(scores) / n
+    variance = sum((s - mean) ** 2 for s in scores) / n
+    lower, upper = math.log(beta / (1 - alpha)), math.log((1 - beta) / alpha)
+    if variance == 0:
+        return 0.0, lower, upper
+    s0, s1 = expectedScore(elo0), expectedScore(elo1)
+    return n * (s1 - s0) * (2 * mean - s0 - s1) / (2 * variance), lower, upper
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))]
+
+
+# play games between agentA and agentB, half of them with agentA as white
+# returns the game dicts of playGame, each with "a" set to the index (0 white, 1 black) of agentA
+def runMatch(agentA, agentB, games=100, workers=None, moveTime=None, randomPlies=4, maxPlies=MAX_PLIES,
+             seed=0, progress=None):
+    tasks = []
+    sides = []
+    for i in range(games):
+        opening = randomOpening(randomPlies, seed + i // 2)
+        if i % 2 == 0:
+            tasks.append((agentA, agentB, opening, moveTime, maxPlies, seed * 1000003 + i))
+        else:
+            tasks.append((agentB, agentA, opening, moveTime, maxPlies, seed * 1000003 + i))
+        sides.append(i % 2)
+    results = []
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1) as executor:
+        futures = {executor.submit(playGame, task): side for task, side in zip(tasks, sides)}
+        for future in concurrent.futures.as_completed(futures):
+            game = future.result()
+            game["a"] = futures[future]
+            results.append(game)
+            if progress is not None:
+                progress(len(results), games)
+    return results
+
+
+def report(agentA, agentB, results, elo0=0.0, elo1=5.0, out=sys.stdout):
+    scores = [game["result"] if game["a"] == 0 else 1 - game["result"] for game in results]
+    wins, draws, losses = scores.count(1), scores.count(0.5), scores.count(0)
+    print("%s vs %s: %d games, +%d =%d -%d, score %.1f%%" %
+          (agentA, agentB, len(scores), wins, draws, losses, 100 * sum(scores) / len(scores)), file=out)
+    elo, low, high = eloInterval(scores)
+    print("elo %+.1f  95%% [%+.1f, %+.1f]" % (elo, low, high), file=out)
+    llr, lower, upper = sprt(scores, elo0, elo1)
+    verdict = "H1 accepted" if llr >= upper else "H0 accepted" if llr <= lower else "continue"
+    print("sprt elo0 %.1f elo1 %.1f: llr %.2f [%.2f, %.2f] %s" % (elo0, elo1, llr, lower, upper, verdict), file=out)
+    reasons = {}
+    for game in results:
+        reasons[game["reason"]] = reasons.get(game["reason"], 0) + 1
+    print("endings:", ", ".join("%s %d" % item for item in sorted(reasons.items())), file=out)
+    for name, index in ((agentA, 0), (agentB, 1)):
+        # agentA played colour game["a"] in every game, agentB the other one
+        latencies = []
+        nodes = 0
+        for game in results:
+            side = game["a"] if index == 0 else 1 - game["a"]
+            latencies += game["latencies"][side]
+            nodes += game["nodes"][side]
+        total = sum(latencies)
+        print("%-12s %6d moves  nps %8d  latency p50 %.3fs p90 %.3fs p99 %.3fs max %.3fs" %
+              (name, len(latencies), nodes / total if total > 0 else 0, percentile(latencies, 50),
+               percentile(latencies, 90), percentile(latencies, 99), max(latencies, default=0.0)), file=out)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="play a match between two agents")
+    parser.add_argument("agentA", help="name[:depth], one of " + ", ".join(AGENTS))
+    parser.add_argument("agentB")
+    parser.add_argument("--games", type=int, default=100)
+    parser.add_argument("--workers", type=int, help="worker processes, the number of CPUs by default")
+    parser.add_argument("--move-time", type=float, help="seconds per move for the search agents")
+    parser.add_argument("--random-plies", type=int, default=4, help="random opening moves before the agents play")
+    parser.add_argument("--max-plies", type=int, default=MAX_PLIES)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--elo0", type=float, default=0.0, help="SPRT null hypothesis")
+    parser.add_argument("--elo1", type=float, default=5.0, help="SPRT alternative hypothesis")
+    args = parser.parse_args(argv)
+    for spec in (args.agentA, args.agentB):
+        makeAgent(spec)  # fail before starting the pool
+
+    def progress(done, total):
+        print("\r%d/%d games" % (done, total), end="", file=sys.stderr, flush=True)
+
+    results = runMatch(args.agentA, args.agentB, args.games, args.workers, args.move_time, args.random_plies,
+                       args.max_plies, args.seed, progress)
+    print(file=sys.stderr)
+    report(args.agentA, args.agentB, results, args.elo0, args.elo1)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,121 @@
+"""
+Fixed-size transposition table for the search agents, keyed by GameState.zobristKey.
+Each bucket holds two entries: a depth-preferred one and an always-replace one.
+LruCache is the plain bounded cache for values computed from a position, like legal moves or pawn structure.
+"""
+
+from collections import OrderedDict
+
+EXACT, LOWER_BOUND, UPPER_BOUND = 0, 1, 2
+
+# rough cost of one slot in bytes: the key, the entry tuple and the list pointers
+ENTRY_SIZE = 128
+
+
+class TranspositionTable:
+    def __init__(self, sizeMB=16):
+        self.resize(sizeMB)
+
+    def resize(self, sizeMB):
+        # round the bucket count down to a power of two so the index is a mask
+        buckets = 1
+        while buckets * 4 * ENTRY_SIZE <= sizeMB * 1024 * 1024:
+            buckets *= 2
+        self.sizeMB = sizeMB
+        self.mask = buckets - 1
+        self.clear()
+
+    def clear(self):
+        size = (self.mask + 1) * 2
+        self.keys = [0] * size
+        # entries are (depth, flag, score, move, age) tuples, None if the slot is unused
+        self.entries = [None] * size
+        self.age = 0
+        self.used = 0
+        self.hits = 0
+        self.misses = 0
+        self.collisions = 0
+
+    # call before every new search so entries from older searches get replaced first
+    def newSearch(self):
+        self.age = (self.age + 1) & 0xFF
+
+    def probe(self, key):
+        i = (key & self.mask) << 1
+        if self.keys[i] == key and self.entries[i] is not None:
+            self.hits += 1
+            return self.entries[i]
+        if self.keys[i + 1] == key and self.entries[i + 1] is not None:
+            self.hits += 1
+            return self.entries[i + 1]
+        self.misses += 1
+        if self.entries[i] is not None or self.entries[i + 1] is not None:
+            # the bucket is in use by other positions
+            self.collisions += 1
+        return None
+
+    def store(self, key, depth, flag, score, move):
+        i = (key & self.mask) << 1
+        entry = (depth, flag, score, move, self.age)
+        old = self.entries[i]
+        if old is None or self.keys[i] == key or depth >= old[0] or old[4] != self.age:
+            # depth-preferred slot: keep the deepest entry of the current search
+            if self.keys[i] != key:
+                if old is not None:
+                    # the displaced entry is still worth keeping in the always-replace slot,
+                    # where it also replaces an older entry of key
+                    if self.entries[i + 1] is None:
+                        self.used += 1
+                    self.keys[i + 1] = self.keys[i]
+                    self.entries[i + 1] = old
+                elif self.keys[i + 1] == key and self.entries[i + 1] is not None:
+                    # key moves up from the always-replace slot, which is left empty
+                    self.keys[i + 1] = 0
+                    self.entries[i + 1] = None
+                else:
+                    self.used += 1
+            self.keys[i] = key
+            self.entries[i] = entry
+        else:
+            if self.entries[i + 1] is None:
+                self.used += 1
+            self.keys[i + 1] = key
+            self.entries[i + 1] = entry
+
+    # share of the slots in use, in permille like the UCI hashfull value
+    def hashfull(self):
+        return self.used * 1000 // len(self.entries)
+
+    def hitRate(self):
+        probes = self.hits + self.misses
+        return self.hits / probes if probes else 0.0
+
+
+# values by key, dropping the least recently used entry when more than maxEntries are stored
+class LruCache:
+    def __init__(self, maxEntries):
+        self.maxEntries = maxEntries
+        self.clear()
+
+    def clear(self):
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def probe(self, key):
+        value = self.entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return value
+
+    def store(self, key, value):
+        self.entries[key] = value
+        if len(self.entries) > self.maxEntries:
+            self.entries.popitem(last=False)
+
+    def hitRate(self):
+        probes = self.hits + self.misses
+        return self.hits / probes if probes else 0.0
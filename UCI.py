@@ -0,0 +1,189 @@
+"""
+UCI front end: play through standard chess GUIs and match managers, without pygame.
+Run as a script and talk UCI over stdin/stdout:
+    python -m shallowBlue.UCI
+The search runs in a background thread, so stop and isready are answered while it thinks.
+"""
+
+import sys
+import threading
+import time
+
+from shallowBlue import Agents
+from shallowBlue import ChessEngine
+
+NAME = "shallowBlue"
+MAX_DEPTH = 32  # depth of "go infinite" and of a go without limits
+DEFAULT_HASH_MB = 16
+
+
+# seconds to spend on a move from the clock: an even share of the remaining time plus most of the increment
+def moveTimeFromClock(remaining, increment=0, movesToGo=None):
+    share = remaining / (movesToGo if movesToGo else 30)
+    # keep a safety margin so the engine never loses on time
+    return max(0.01, min(share + increment * 0.8, remaining * 0.5 - 0.05))
+
+
+# the UCI score of a search score: "cp 35", or "mate 3" / "mate -2" in moves when a mate was found
+def formatScore(score):
+    if score > Agents.MATE_SCORE - Agents.MAX_PLY:
+        return "mate %d" % ((Agents.MATE_SCORE - score + 1) // 2)
+    if score < -Agents.MATE_SCORE + Agents.MAX_PLY:
+        return "mate %d" % -((Agents.MATE_SCORE + score) // 2)
+    return "cp %d" % score
+
+
+class UciEngine:
+    def __init__(self, out=sys.stdout):
+        self.out = out
+        self.outLock = threading.Lock()
+        self.gameState = ChessEngine.GameState()
+        self.agent = Agents.ABAgent(ChessEngine.evaluate, tableSizeMB=DEFAULT_HASH_MB, reporter=self.reportInfo)
+        self.searchThread = None
+        self.infinite = False
+        self.stopEvent = threading.Event()  # set by stop, ends a "go infinite" that finished on its own
+
+    def send(self, line):
+        with self.outLock:
+            self.out.write(line + "\n")
+            self.out.flush()
+
+    def reportInfo(self, info):
+        self.send("info depth %d score %s nodes %d nps %d time %d hashfull %d pv %s" %
+                  (info["depth"], formatScore(info["score"]), info["nodes"], info["nps"], int(info["time"] * 1000),
+                   self.agent.table.hashfull(), " ".join(move.getUci() for move in info["pv"])))
+
+    # handle one line from the GUI, returns False on quit
+    def command(self, line):
+        tokens = line.split()
+        if not tokens:
+            return True
+        name, args = tokens[0], tokens[1:]
+        if name == "uci":
+            self.send("id name " + NAME)
+            self.send("id author weixyi")
+            self.send("option name Hash type spin default %d min 1 max 1024" % DEFAULT_HASH_MB)
+            self.send("uciok")
+        elif name == "isready":
+            self.send("readyok")
+        elif name == "setoption":
+            self.setOption(args)
+        elif name == "ucinewgame":
+            self.waitForSearch()
+            self.agent.table.clear()
+            self.agent.history = {}
+        elif name == "position":
+            self.waitForSearch()
+            self.setPosition(args)
+        elif name == "go":
+            self.waitForSearch()
+            self.go(args)
+        elif name == "stop":
+            self.stopSearch()
+        elif name == "quit":
+            self.stopSearch()
+            return False
+        return True
+
+    def setOption(self, args):
+        # setoption name <id> [value <x>]
+        text = " ".join(args)
+        if "value" not in args:
+            return
+        optionName = text.split(" value ", 1)[0].replace("name ", "", 1).strip().lower()
+        value = text.split(" value ", 1)[1].strip()
+        if optionName == "hash" and value.isdigit():
+            self.waitForSearch()
+            self.agent.table.resize(max(1, int(value)))
+
+    def setPosition(self, args):
+        if "moves" in args:
+            index = args.index("moves")
+            setup, moves = args[:index], args[index + 1:]
+        else:
+            setup, moves = args, []
+        try:
+            if setup[:1] == ["fen"]:
+                gameState = ChessEngine.GameState(" ".join(setup[1:]))
+            else:
+                gameState = ChessEngine.GameState()
+            for uci in moves:
+                gameState.makeMove(gameState.parseUci(uci))
+        except (ValueError, IndexError) as e:
+            self.send("info string bad position: %s" % e)
+            return
+        self.gameState = gameState
+
+    def go(self, args):
+        options = {}
+        flags = set()
+        i = 0
+        while i < len(args):
+            if args[i] in ("infinite", "ponder"):
+                flags.add(args[i])
+                i += 1
+            else:
+                if i + 1 < len(args):
+                    try:
+                        options[args[i]] = int(args[i + 1])
+                    except ValueError:
+                        pass
+                i += 2
+        agent = self.agent
+        agent.depth = min(options.get("depth", MAX_DEPTH), MAX_DEPTH)
+        agent.nodeLimit = options.get("nodes")
+        agent.timeLimit = None
+        if "movetime" in options:
+            agent.timeLimit = options["movetime"] / 1000
+        elif not flags:
+            clock, increment = ("wtime", "winc") if self.gameState.whiteToMove else ("btime", "binc")
+            if clock in options:
+                agent.timeLimit = moveTimeFromClock(options[clock] / 1000, options.get(increment, 0) / 1000,
+                                                    options.get("movestogo"))
+        agent.stopRequested = False
+        self.infinite = bool(flags)
+        self.stopEvent.clear()
+        # the search gets its own copy, a later position command must not change the board under it
+        self.searchThread = threading.Thread(target=self.search, args=(self.gameState.copy(),), daemon=True)
+        self.searchThread.start()
+
+    def search(self, gameState):
+        start = time.perf_counter()
+        move = self.agent.getAction(gameState)
+        if move is None:
+            moves = gameState.getValidMoves()
+            move = moves[0] if moves else None
+        self.send("info string searched %d nodes in %.3fs" % (self.agent.nodes, time.perf_counter() - start))
+        # in infinite mode the GUI expects bestmove only after it sends stop
+        if self.infinite:
+            self.stopEvent.wait()
+        self.send("bestmove " + (move.getUci() if move is not None else "0000"))
+
+    def stopSearch(self):
+        if self.searchThread is not None:
+            self.agent.stop()
+            self.stopEvent.set()
+            self.searchThread.join()
+            self.searchThread = None
+
+    # a new search or position waits for the running search, which a GUI should have stopped already
+    def waitForSearch(self):
+        if self.searchThread is not None:
+            if self.infinite:
+                self.stopSearch()
+            else:
+                self.searchThread.join()
+                self.searchThread = None
+
+
+def main(stdin=sys.stdin, stdout=sys.stdout):
+    engine = UciEngine(stdout)
+    for line in stdin:
+        if not engine.command(line):
+            break
+    engine.stopSearch()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
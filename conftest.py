@@ -0,0 +1,32 @@
+"""
+pytest setup: the modules import each other as shallowBlue.X, so the checkout is made importable under that name
+whatever its directory is called. Slow tests only run with --runslow.
+"""
+
+import os
+import sys
+import types
+
+import pytest
+
+if "shallowBlue" not in sys.modules:
+    _package = types.ModuleType("shallowBlue")
+    _package.__path__ = [os.path.dirname(os.path.abspath(__file__))]
+    sys.modules["shallowBlue"] = _package
+
+
+def pytest_addoption(parser):
+    parser.addoption("--runslow", action="store_true", help="also run the slow tests, like the deep perft counts")
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "slow: takes minutes, only runs with --runslow")
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption("--runslow"):
+        return
+    skip = pytest.mark.skip(reason="slow, use --runslow")
+    for item in items:
+        if "slow" in item.keywords:
+            item.add_marker(skip)
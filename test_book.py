@@ -0,0 +1,76 @@
+"""
+Opening books: building one from PGN, looking moves up directly and with colours swapped, and picking one.
+"""
+
+import random
+
+import pytest
+
+from shallowBlue import Book
+from shallowBlue import ChessEngine
+
+GAMES = """[Result "1-0"]
+
+1. e4 e5 2. Nf3 1-0
+
+[Result "1/2-1/2"]
+
+1. d4 d5 2. c4 1/2-1/2
+"""
+
+
+# a random number generator that always draws the same number
+class FixedRng:
+    def __init__(self, value):
+        self.value = value
+
+    def randrange(self, stop):
+        assert 0 <= self.value < stop
+        return self.value
+
+
+@pytest.fixture
+def book(tmp_path):
+    pgnPath = tmp_path / "games.pgn"
+    pgnPath.write_text(GAMES)
+    bookPath = tmp_path / "games.bin"
+    # e4 2, d4 1, d5 1, Nf3 2, c4 1; e5 scored nothing in a lost game and is left out
+    assert Book.BuildBook(str(pgnPath), str(bookPath)) == 5
+    book = Book.BookDataStruct(str(bookPath))
+    yield book
+    book.close()
+
+
+def bookMoves(gameState, book):
+    return [(ChessEngine.Move.fromCode(bk.move).getUci(), bk.score) for bk in Book.GetBookMoves(gameState, book)]
+
+
+def test_weights_and_order(book):
+    gameState = ChessEngine.GameState()
+    assert bookMoves(gameState, book) == [("e2e4", 2), ("d2d4", 1)]
+    assert Book.ChooseBookMove(gameState, book, FixedRng(1)).getUci() == "e2e4"
+    assert Book.ChooseBookMove(gameState, book, FixedRng(2)).getUci() == "d2d4"
+    gameState.makeMove(gameState.parseSan("e4"))
+    assert bookMoves(gameState, book) == []
+    assert Book.ChooseBookMove(gameState, book) is None
+    gameState.makeMove(gameState.parseSan("e5"))
+    assert bookMoves(gameState, book) == [("g1f3", 2)]
+
+
+def test_mirrored_lookup(book):
+    gameState = ChessEngine.GameState()
+    gameState.makeMove(gameState.parseSan("d4"))
+    assert bookMoves(gameState, book) == [("d7d5", 1)]
+    # the same position with the colours swapped, white to move, is only in the book mirrored
+    swapped = ChessEngine.GameState("rnbqkbnr/ppp1pppp/8/3p4/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1")
+    assert swapped.mirroredZobristKey() == gameState.zobristKey
+    assert bookMoves(swapped, book) == [("d2d4", 1)]
+
+
+def test_empty_book(tmp_path):
+    path = tmp_path / "empty.bin"
+    path.write_bytes(b"")
+    book = Book.BookDataStruct(str(path))
+    assert Book.GetBookMoves(ChessEngine.GameState(), book) == []
+    assert Book.ChooseBookMove(ChessEngine.GameState(), book, random.Random(0)) is None
+    book.close()
@@ -0,0 +1,74 @@
+"""
+Repetitions, the fifty-move rule and the halfmove clock, and the en passant part of the zobrist key they rely on.
+"""
+
+from shallowBlue import ChessEngine
+
+
+def play(sans, fen=ChessEngine.START_FEN):
+    gameState = ChessEngine.GameState(fen)
+    for san in sans.split():
+        gameState.makeMove(gameState.parseSan(san))
+    gameState.getValidMoveCodes()  # drawReason needs the checkmate flag of the position
+    return gameState
+
+
+def test_threefold_repetition_counts_the_position_after_a_double_push():
+    gameState = play("e4 Nf6 Nf3 Ng8 Ng1")
+    assert gameState.isRepetition()
+    assert gameState.drawReason() is None
+    for san in "Nf6 Nf3 Ng8".split():
+        gameState.makeMove(gameState.parseSan(san))
+        gameState.getValidMoveCodes()
+        assert gameState.drawReason() is None
+    gameState.makeMove(gameState.parseSan("Ng1"))
+    gameState.getValidMoveCodes()
+    assert gameState.drawReason() == "threefold repetition"
+    gameState.undoMove()
+    assert gameState.drawReason() is None
+
+
+def test_repetition_window_ends_at_an_irreversible_move():
+    gameState = play("Nf3 Nf6 Ng1 Ng8 e4")
+    # the start position came back, but e4 can not be undone by the moves after it
+    assert not gameState.isRepetition()
+    assert play("Nf3 Nf6 Ng1 Ng8").isRepetition()
+
+
+def test_en_passant_key_only_when_a_capture_is_possible():
+    assert play("e4").zobristKey == ChessEngine.GameState(
+        "rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq - 0 1").zobristKey
+    gameState = play("e4 a6 e5 d5")
+    assert gameState.zobristKey != ChessEngine.GameState(
+        "rnbqkbnr/1pp1pppp/p7/3pP3/8/8/PPPP1PPP/RNBQKBNR w KQkq - 0 3").zobristKey
+    assert gameState.zobristKey == gameState.computeZobristKey()
+    assert gameState.zobristKey == ChessEngine.GameState(gameState.toFen()).zobristKey
+
+
+def test_halfmove_clock():
+    gameState = play("Nf3 Nf6 Ng1")
+    assert gameState.halfmoveClock == 3
+    gameState.makeMove(gameState.parseSan("e5"))
+    assert gameState.halfmoveClock == 0
+    gameState.undoMove()
+    assert gameState.halfmoveClock == 3
+    gameState = play("Nc3 d5 Nxd5")
+    assert gameState.halfmoveClock == 0
+    gameState.undoMove()
+    assert gameState.halfmoveClock == 0
+    gameState.undoMove()
+    assert gameState.halfmoveClock == 1
+
+
+def test_fifty_move_rule():
+    fen = "4k3/8/8/8/8/8/4P3/R3K3 w - - 99 80"
+    assert play("", fen).drawReason() is None
+    assert play("Ra2", fen).drawReason() == "fifty-move rule"
+    assert play("e4", fen).drawReason() is None
+
+
+def test_checkmate_on_the_hundredth_ply_wins():
+    gameState = play("Ra8#", "4k3/R7/4K3/8/8/8/8/8 w - - 99 80")
+    assert gameState.checkmate
+    assert gameState.halfmoveClock == 100
+    assert gameState.drawReason() is None
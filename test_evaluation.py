@@ -0,0 +1,52 @@
+"""
+The BatchEvaluation functions must give exactly the scores of the scalar evaluators in ChessEngine,
+for both the (N, 64) piece code rows and the (N, 12, 8, 8) planes.
+"""
+
+import random
+
+import numpy as np
+import pytest
+
+from shallowBlue import ChessEngine
+from shallowBlue import BatchEvaluation
+
+
+# positions from random games, a fixed seed keeps them the same on every run
+def randomPositions(games=12, plies=120, seed=0):
+    rng = random.Random(seed)
+    positions = []
+    for game in range(games):
+        gameState = ChessEngine.GameState()
+        for ply in range(plies):
+            moves = gameState.getValidMoveCodes()
+            if not moves:
+                break
+            gameState.makeMove(rng.choice(moves))
+            if ply % 2 == 0:
+                positions.append(gameState.copy())
+    return positions
+
+
+POSITIONS = randomPositions()
+LAYOUTS = {
+    "codes": np.stack([gameState.toArray() for gameState in POSITIONS]),
+    "planes": np.stack([gameState.toPlanes() for gameState in POSITIONS]),
+}
+
+
+@pytest.mark.parametrize("layout", sorted(LAYOUTS))
+@pytest.mark.parametrize("batch, scalar", [
+    (BatchEvaluation.batchMaterial, ChessEngine.materialBalance),
+    (BatchEvaluation.batchTapered, ChessEngine.taperedEval),
+    (BatchEvaluation.batchPawnStructure, ChessEngine.pawnStructure),
+    (BatchEvaluation.batchEvaluate, lambda gameState: ChessEngine.taperedEval(gameState) +
+     ChessEngine.pawnStructure(gameState)),
+], ids=["material", "tapered", "pawnStructure", "evaluate"])
+def test_batch_matches_scalar(layout, batch, scalar):
+    assert batch(LAYOUTS[layout]).tolist() == [scalar(gameState) for gameState in POSITIONS]
+
+
+def test_layouts_agree():
+    planes, codes = LAYOUTS["planes"], LAYOUTS["codes"]
+    assert BatchEvaluation.pieceCodes(planes).tolist() == BatchEvaluation.pieceCodes(codes).tolist()
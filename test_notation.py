@@ -0,0 +1,113 @@
+"""
+FEN, SAN and UCI notation of GameState and Move: reading back what was written gives the same position or move.
+"""
+
+import random
+
+import pytest
+
+from shallowBlue import ChessEngine
+from shallowBlue import Perft
+
+
+# the position after every ply of a few seeded random games
+def randomGames(games=10, plies=150, seed=0):
+    rng = random.Random(seed)
+    for game in range(games):
+        gameState = ChessEngine.GameState()
+        for ply in range(plies):
+            moves = gameState.getValidMoveCodes()
+            if not moves:
+                break
+            yield gameState, moves
+            gameState.makeMove(rng.choice(moves))
+
+
+@pytest.mark.parametrize("fen", [fen for name, fen, counts in Perft.PERFT_SUITE])
+def test_suite_fen_round_trip(fen):
+    assert ChessEngine.GameState(fen).toFen() == fen
+
+
+def test_fen_round_trip():
+    for gameState, moves in randomGames():
+        fen = gameState.toFen()
+        loaded = ChessEngine.GameState(fen)
+        assert loaded.toFen() == fen
+        assert loaded.zobristKey == gameState.zobristKey
+        assert sorted(loaded.getValidMoveCodes()) == sorted(moves)
+
+
+@pytest.mark.parametrize("fen", [
+    "8/8/8/8/8/8/8/k6K w - z9 0 1",
+    "8/8/8/8/8/8/8/k6K w - e9 0 1",
+    "8/8/8/8/8/8/8/k6K w - e4 0 1",
+    "8/8/8/8/8/8/8/k6K x - - 0 1",
+    "8/8/8/8/8/8/8/k6K w - - x 1",
+    "8/8/8/8/8/8/8/k7 w - - 0 1",
+    "8/8/8/8/8/8/k6K w - - 0 1",
+    "8/8/8/8/8/8/8/k6K w",
+    "4k3/8/8/3P4/8/8/8/4K3 w - e6 0 1",
+    "4k3/8/8/3Pp3/8/8/8/4K3 b - e6 0 1",
+    "4k3/8/8/3Pp3/8/8/8/4K3 w - e3 0 1",
+    "4k3/4r3/8/3Pp3/8/8/8/4K3 w - e6 0 1",
+    "4k3/8/8/8/3pP3/8/4R3/4K3 b - e3 0 1",
+    "4k3/8/8/8/8/8/8/4K3 w K - 0 1",
+    "4k3/8/8/8/8/8/8/R3K3 w K - 0 1",
+    "1r2k3/8/8/8/8/8/8/4K3 w q - 0 1",
+    "4k2r/8/8/8/8/8/8/3K3R w Kk - 0 1",
+    "4k3/8/8/8/8/8/8/R3K2R w KX - 0 1",
+])
+def test_bad_fen(fen):
+    with pytest.raises(ValueError):
+        ChessEngine.GameState(fen)
+
+
+def test_consistent_fen_fields():
+    assert ChessEngine.GameState("4k3/8/8/3Pp3/8/8/8/4K3 w - e6 0 1").enPassantGrid == (2, 4)
+    assert ChessEngine.GameState("4k3/8/8/8/3pP3/8/8/4K3 b - e3 0 1").enPassantGrid == (5, 4)
+    castle = ChessEngine.GameState("r3k2r/8/8/8/8/8/8/R3K2R w KQkq - 0 1").currentCastle
+    assert (castle.wks, castle.wqs, castle.bks, castle.bqs) == (True, True, True, True)
+
+
+def test_san_and_uci_round_trip():
+    for gameState, moves in randomGames():
+        for move in moves:
+            san = gameState.toSan(move)
+            assert gameState.parseSan(san) == move, san
+            assert ChessEngine.Move.fromCode(move).getSan(gameState) == san
+            assert gameState.parseUci(ChessEngine.Move.fromCode(move).getUci()) == move
+
+
+@pytest.mark.parametrize("fen, san, uci", [
+    ("r3k2r/8/8/8/8/8/8/R3K2R w KQkq - 0 1", "O-O-O", "e1c1"),
+    ("r3k2r/8/8/8/8/8/8/R3K2R b KQkq - 0 1", "O-O", "e8g8"),
+    ("4k3/8/8/3pP3/8/8/8/4K3 w - d6 0 1", "exd6", "e5d6"),
+    ("1n2k3/P7/8/8/8/8/8/4K3 w - - 0 1", "axb8=N", "a7b8n"),
+    ("4k3/8/8/8/8/8/8/1N3N1K w - - 0 1", "Nbd2", "b1d2"),
+    ("4k3/8/8/8/8/8/4K3/R6R w - - 0 1", "Rad1", "a1d1"),
+    ("R6k/8/8/8/8/8/8/R3K3 w - - 0 1", "R1a7#", "a1a7"),
+    ("7k/8/6K1/8/8/8/8/Q7 w - - 0 1", "Qa8#", "a1a8"),
+    ("7k/8/8/8/8/8/6Q1/K7 w - - 0 1", "Qg7+", "g2g7"),
+])
+def test_san(fen, san, uci):
+    gameState = ChessEngine.GameState(fen)
+    move = gameState.parseUci(uci)
+    assert gameState.toSan(move) == san
+    assert gameState.parseSan(san) == move
+
+
+# pawn moves onto the wrong end of the board are illegal, not out of range
+@pytest.mark.parametrize("fen, san", [
+    ("r1bqkbnr/pppp1ppp/2n5/4p3/8/2N5/PPPPPPPP/R1BQKBNR w KQkq - 0 1", "b1=Q"),
+    ("4k3/8/8/8/8/8/8/4K3 w - - 0 1", "a1=Q"),
+    ("4k3/8/8/8/8/8/8/4K3 w - - 0 1", "a1"),
+    ("4k3/8/8/8/8/8/8/4K3 w - - 0 1", "h2"),
+    ("4k3/8/8/8/8/8/8/4K3 b - - 0 1", "a8=Q"),
+    ("4k3/8/8/8/8/8/8/4K3 b - - 0 1", "a8"),
+    ("4k3/8/8/8/8/8/8/4K3 b - - 0 1", "h7"),
+    ("4k3/P7/8/8/8/8/8/4K3 w - - 0 1", "a8"),
+    ("4k3/8/P7/8/8/8/8/4K3 w - - 0 1", "a7=Q"),
+])
+def test_bad_pawn_san(fen, san):
+    with pytest.raises(ValueError):
+        ChessEngine.GameState(fen).parseSan(san)
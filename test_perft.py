@@ -0,0 +1,36 @@
+"""
+Perft counts of Perft.PERFT_SUITE, the same positions python -m shallowBlue.Perft times.
+Depths above FAST_DEPTH are marked slow.
+"""
+
+import pytest
+
+from shallowBlue import ChessEngine
+from shallowBlue import Perft
+
+FAST_DEPTH = 3
+
+CASES = [pytest.param(fen, depth, count, id="%s-%d" % (name, depth),
+                      marks=[pytest.mark.slow] if depth > FAST_DEPTH else [])
+         for name, fen, counts in Perft.PERFT_SUITE for depth, count in sorted(counts.items())]
+
+
+@pytest.mark.parametrize("fen, depth, count", CASES)
+def test_perft(fen, depth, count):
+    assert Perft.perft(ChessEngine.GameState(fen, moveCacheSize=0), depth) == count
+
+
+# the move cache must not change the counts
+def test_perft_with_move_cache():
+    assert Perft.perft(ChessEngine.GameState(Perft.PERFT_SUITE[1][1]), 3) == Perft.PERFT_SUITE[1][2][3]
+
+
+# getValidMoves against the make/undo filtering generator, and getCaptureCodes against both
+@pytest.mark.parametrize("name, fen", [(name, fen) for name, fen, counts in Perft.PERFT_SUITE])
+def test_generators_agree(name, fen):
+    assert Perft.compareGenerators(ChessEngine.GameState(fen, moveCacheSize=0), 2) is None
+
+
+# the incremental zobrist keys and scores against a full recomputation, over random games
+def test_incremental_state():
+    assert Perft.checkIncremental() is None
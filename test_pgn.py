@@ -0,0 +1,71 @@
+"""
+Pgn: reading games with comments and variations, decoding them, and writing them back.
+"""
+
+from shallowBlue import ChessEngine
+from shallowBlue import Pgn
+
+TWO_GAMES = """[Event "Test"]
+[White "A \\"quoted\\" name"]
+[Black "B"]
+[Result "1-0"]
+
+1. e4 {a comment
+over two lines} e5 2.Nf3 (2. f4 exf4 (2... d5) 3. Nf3) Nc6 $1 3. Bc4 ; rest of the line
+Nf6?! 4. Ng5 d5 5. exd5 Nxd5 6. Nxf7 1-0
+
+[Event "Test"]
+[SetUp "1"]
+[FEN "4k3/8/8/8/8/8/8/R3K2R w KQ - 0 1"]
+%an escaped line 1. a4
+1. O-O-O Kf7 2. Rd7+ *
+"""
+
+
+def readTwoGames(tmp_path):
+    path = tmp_path / "games.pgn"
+    path.write_text(TWO_GAMES)
+    return list(Pgn.readGames(str(path)))
+
+
+def test_read_games(tmp_path):
+    first, second = readTwoGames(tmp_path)
+    assert first.headers["White"] == 'A "quoted" name'
+    assert first.sans == ["e4", "e5", "Nf3", "Nc6", "Bc4", "Nf6?!", "Ng5", "d5", "exd5", "Nxd5", "Nxf7"]
+    assert first.result == "1-0"
+    assert second.startFen() == "4k3/8/8/8/8/8/8/R3K2R w KQ - 0 1"
+    assert second.sans == ["O-O-O", "Kf7", "Rd7+"]
+    assert second.result == "*"
+
+
+def test_decode_and_write(tmp_path):
+    first, second = readTwoGames(tmp_path)
+    for game in (first, second):
+        game.decode()
+        assert game.error is None
+        assert len(game.codes) == len(game.sans)
+    gameState = first.gameState()
+    assert gameState.toFen() == "r1bqkb1r/ppp2Npp/2n5/3np3/2B5/8/PPPP1PPP/RNBQK2R b KQkq - 0 6"
+    path = tmp_path / "written.pgn"
+    path.write_text(Pgn.gameToPgn(gameState, first.headers, first.result) + "\n" +
+                    Pgn.gameToPgn(second.gameState(), result=second.result))
+    written = list(Pgn.readGames(str(path)))
+    assert [game.decode().codes for game in written] == [first.codes, second.codes]
+    assert written[0].headers["White"] == 'A "quoted" name'
+
+
+def test_decode_stops_at_a_bad_move():
+    game = Pgn.PgnGame({}, ["e4", "e5", "Ke3"], "*").decode()
+    assert len(game.codes) == 2
+    assert game.error.startswith("ply 3")
+    assert game.gameState().toFen() == ChessEngine.GameState("rnbqkbnr/pppp1ppp/8/4p3/4P3/8/PPPP1PPP/RNBQKBNR w "
+                                                             "KQkq e6 0 2").toFen()
+
+
+def test_bad_promotion_is_a_decode_error(tmp_path):
+    path = tmp_path / "bad.pgn"
+    path.write_text("1. Nc3 e5 2. b1=Q *\n\n1. e4 e5 *\n")
+    first, second = Pgn.readDecodedGames(str(path))
+    assert len(first.codes) == 2
+    assert first.error.startswith("ply 3")
+    assert second.error is None
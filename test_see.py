@@ -0,0 +1,44 @@
+"""
+GameState.see on fixed positions, and the capture generator it is used with.
+"""
+
+import pytest
+
+from shallowBlue import ChessEngine
+
+
+@pytest.mark.parametrize("fen, uci, gain", [
+    # undefended pieces
+    ("4k3/8/8/3q4/8/8/8/3RK3 w - - 0 1", "d1d5", 900),
+    ("4k3/8/8/3p4/4P3/8/8/4K3 w - - 0 1", "e4d5", 100),
+    # defended by a pawn
+    ("4k3/8/2p5/3p4/8/8/8/3QK3 w - - 0 1", "d1d5", -800),
+    ("4k3/8/2p5/3p4/4P3/8/8/4K3 w - - 0 1", "e4d5", 0),
+    ("4k3/8/2p5/3n4/4P3/8/8/4K3 w - - 0 1", "e4d5", 200),
+    # the rook behind joins in once the one in front has taken
+    ("3rk3/8/8/3p4/8/8/3R4/3RK3 w - - 0 1", "d2d5", 100),
+    ("3rk3/8/8/3p4/8/8/3R4/4K3 w - - 0 1", "d2d5", -400),
+    ("3rk3/3r4/8/3p4/8/8/3R4/3RK3 w - - 0 1", "d2d5", -400),
+    # en passant, for both colours
+    ("4k3/8/8/3pP3/8/8/8/4K3 w - d6 0 1", "e5d6", 100),
+    ("4k3/8/8/8/3pP3/8/5K2/8 b - e3 0 1", "d4e3", 0),
+    # the king may only take a piece nobody defends
+    ("8/8/4k3/3p4/8/8/3Q4/4K3 w - - 0 1", "d2d5", -800),
+    ("8/8/4k3/3p4/8/8/3Q4/3RK3 w - - 0 1", "d2d5", 100),
+    # promotions count the new piece
+    ("1n2k3/P7/8/8/8/8/8/4K3 w - - 0 1", "a7a8q", 800),
+    ("1n2k3/P7/8/8/8/8/8/4K3 w - - 0 1", "a7b8q", 1100),
+])
+def test_see(fen, uci, gain):
+    gameState = ChessEngine.GameState(fen)
+    move = gameState.parseUci(uci)
+    before = (gameState.toFen(), gameState.zobristKey)
+    assert gameState.see(move) == gain
+    assert (gameState.toFen(), gameState.zobristKey) == before
+
+
+def test_capture_codes():
+    gameState = ChessEngine.GameState("r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1")
+    captures = gameState.getCaptureCodes()
+    assert sorted(ChessEngine.Move.fromCode(move).getUci() for move in captures) == \
+        ["d5e6", "e2a6", "e5d7", "e5f7", "e5g6", "f3f6", "f3h3", "g2h3"]
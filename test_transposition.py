@@ -0,0 +1,50 @@
+"""
+TranspositionTable buckets: one entry per key, and the used count behind hashfull.
+"""
+
+from shallowBlue import Transposition
+
+EXACT = Transposition.EXACT
+
+
+# keys of the same bucket in a one bucket table
+def smallTable():
+    table = Transposition.TranspositionTable(0)
+    assert table.mask == 0
+    return table
+
+
+def bucket(table):
+    return [(key, entry[0]) for key, entry in zip(table.keys, table.entries) if entry is not None]
+
+
+def test_deeper_entry_moves_up_from_the_always_replace_slot():
+    table = smallTable()
+    table.store(1, 5, EXACT, 0, None)
+    table.store(2, 3, EXACT, 0, None)  # shallower, goes to the always-replace slot
+    assert bucket(table) == [(1, 5), (2, 3)]
+    table.store(2, 7, EXACT, 0, None)  # now wins the depth-preferred slot, 1 is moved down over the old 2
+    assert bucket(table) == [(2, 7), (1, 5)]
+    assert table.probe(2)[0] == 7
+    assert table.used == 2
+
+
+def test_key_moves_up_into_an_empty_depth_slot():
+    table = smallTable()
+    table.store(1, 5, EXACT, 0, None)
+    table.store(2, 3, EXACT, 0, None)
+    table.entries[0] = None  # as if the depth-preferred entry was never there
+    table.keys[0] = 0
+    table.used -= 1
+    table.store(2, 4, EXACT, 0, None)
+    assert bucket(table) == [(2, 4)]
+    assert table.used == 1
+
+
+def test_replace_same_key():
+    table = smallTable()
+    table.store(1, 5, EXACT, 0, None)
+    table.store(1, 2, EXACT, 10, None)
+    assert bucket(table) == [(1, 2)]
+    assert table.probe(1)[2] == 10
+    assert table.used == 1